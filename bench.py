@@ -0,0 +1,240 @@
+#! /usr/bin/env python3
+
+# benchmarks for dinant: how long it takes to build, flatten, compile and match
+# some expressions, the standard ones and the real life ones from run_tests()
+#
+# $ python3 bench.py --output before.json
+# ... hack, hack, hack ...
+# $ python3 bench.py --output after.json --compare before.json
+
+import argparse
+import json
+import platform
+import random
+import re
+import sys
+import tempfile
+import time
+
+import dinant as d
+
+
+# expressions
+# these are functions so each run builds them from scratch
+def timestamp_re(capt=True):
+    if capt:
+        return d.then('[') + d.capture(d.datetime("%b %d %H:%M:%S"), name='timestamp') + d.then(']')
+    else:
+        return d.then('[') + d.datetime("%b %d %H:%M:%S") + d.then(']')
+
+
+def begin_SIP_message_re():
+    line_re = d.bol + timestamp_re() + d.then(' ')
+
+    return ( line_re + d.then('<--- ') + d.either('SIP read from UDP:', 'Transmitting (no NAT) to ') +
+             d.capture(d.IP_port, name='client') + d.then(' --->') )
+
+
+def call_re():
+    line_re = d.bol + timestamp_re() + d.then(' ')
+    pid_re = d.then('[') + d.integer + d.then(']')
+    call_id_re = '[C-' + d.capture(d.one_or_more(d.any_of('0-9a-f')), name='call_id') + ']'
+
+    return ( line_re + d.either('VERBOSE') + pid_re + call_id_re + ' ' +
+             d.one_or_more(d.any_of('a-z_\\.')) + ': ' + timestamp_re(capt=False) + ' ' )
+
+
+def render_time_re():
+    identifier_re = d.one_or_more(d.any_of('A-Za-z0-9-'))
+
+    return ( d.bol + d.float(capture='wall_time') + 'ms ' +
+             '(cpu ' + d.float(capture='cpu_time') + 'ms)' + d.one_or_more(' ') + '| ' +
+             "rendering style for layer: '" + identifier_re(capture='layer') + "' " +
+             "and style '" + identifier_re(capture='style') + "'" + d.eol )
+
+
+# lines that match each expression
+def random_float():
+    return '%.2f' % random.uniform(-100000, 100000)
+
+def random_ip():
+    return '.'.join(str(random.randint(0, 255)) for i in range(4))
+
+def random_timestamp():
+    return 'Apr %02d %02d:%02d:%02d' % (random.randint(1, 30), random.randint(0, 23),
+                                        random.randint(0, 59), random.randint(0, 59))
+
+def random_identifier():
+    return ''.join(random.choice('abcdefghijklmnopqrstuvwxyz-') for i in range(random.randint(3, 15)))
+
+
+expressions = {
+    'integer': (lambda: d.bol + d.integer + d.eol, lambda: str(random.randint(-10**9, 10**9))),
+    'float': (lambda: d.bol + d.float + d.eol, random_float),
+    'IPv4': (lambda: d.bol + d.IPv4 + d.eol, random_ip),
+    'IP_port': (lambda: d.bol + d.IP_port + d.eol,
+                lambda: '%s:%d' % (random_ip(), random.randint(1, 65535))),
+    'datetime': (lambda: d.bol + d.datetime() + d.eol,
+                 lambda: 'Fri %s 2017' % random_timestamp()),
+    'begin_SIP_message': (begin_SIP_message_re,
+                          lambda: '[%s] <--- Transmitting (no NAT) to %s:5060 --->' % (random_timestamp(),
+                                                                                     random_ip())),
+    'call': (call_re,
+             lambda: '[%s] VERBOSE[%d][C-%08x] chan_sip.c: [%s] Sending to %s:5060 (no NAT)' %
+                     (random_timestamp(), random.randint(1, 65535), random.getrandbits(32),
+                      random_timestamp(), random_ip())),
+    'render_time': (render_time_re,
+                    lambda: "%sms (cpu %sms) | rendering style for layer: '%s' and style '%s'" %
+                            (random_float(), random_float(), random_identifier(), random_identifier())),
+    }
+
+
+def noise():
+    """A line that, most probably, matches nothing."""
+    return '[%s] DEBUG[%d] %s' % (random_timestamp(), random.randint(1, 65535), random_identifier() * 3)
+
+
+def corpus(generate, size, ratio=0.05):
+    """size lines, ratio of them matching."""
+    return [ generate() if random.random() < ratio else noise() for i in range(size) ]
+
+
+# measuring
+def timeit(function, repeat, setup=None):
+    """Returns the best time of repeat runs of function. setup, if given, is
+    called before each run, out of the clock."""
+    best = None
+
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def forget_strings(node):
+    """The nodes are interned and remember their flattened strings, so building
+    the expression again flattens nothing; this makes them forget them."""
+    stack = [ node ]
+    seen = set()
+
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+
+        if isinstance(item, d._Cached):
+            item.string = None
+        stack.extend(part for part in item.parts() if not isinstance(part, str))
+
+
+def bench_expression(name, build, generate, sizes, repeat):
+    results = []
+
+    def result(stage, seconds, size=1):
+        results.append(dict(expression=name, stage=stage, size=size, seconds=seconds,
+                            per_second=size / seconds if seconds > 0 else None))
+
+    result('build', timeit(build, repeat))
+
+    regexp = build()
+    result('str', timeit(lambda: d._flatten(regexp.node), repeat,
+                         setup=lambda: forget_strings(regexp.node)))
+    expression = str(regexp.simplify())
+
+    def compile():
+        re.purge()
+        re.compile(expression)
+
+    result('simplify', timeit(regexp.simplify, repeat))
+    result('compile', timeit(compile, repeat))
+
+    for size in sizes:
+        lines = corpus(generate, size)
+
+        def match():
+            for line in lines:
+                regexp.match(line)
+
+        def parse():
+            for line in lines:
+                regexp.parse(line)
+
+        # compile and build the matchers out of the clock
+        regexp.match(lines[0])
+        regexp.parse(lines[0])
+
+        result('match', timeit(match, repeat), size)
+        result('parse', timeit(parse, repeat), size)
+
+        with tempfile.NamedTemporaryFile(suffix='.log') as f:
+            f.write('\n'.join(lines).encode())
+            f.flush()
+
+            result('scan', timeit(lambda: sum(1 for match in regexp.scan(f.name)), repeat), size)
+
+    return results
+
+
+def compare(old, new):
+    old = { (result['expression'], result['stage'], result['size']): result['seconds']
+            for result in old['results'] }
+
+    print('%-20s %-10s %8s %12s %12s %8s' % ('expression', 'stage', 'size', 'old', 'new', 'new/old'))
+    for result in new['results']:
+        key = (result['expression'], result['stage'], result['size'])
+        if key not in old:
+            continue
+
+        ratio = result['seconds'] / old[key] if old[key] > 0 else float('inf')
+        print('%-20s %-10s %8d %12.6f %12.6f %8.2f' % (key + (old[key], result['seconds'], ratio)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks dinant.')
+    parser.add_argument('-s', '--sizes', default='1000,10000,100000',
+                        help='comma separated sizes of the corpora, in lines (default: %(default)s).')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='how many times to run each benchmark; the best one is kept (default: %(default)s).')
+    parser.add_argument('-e', '--expressions', default=','.join(expressions),
+                        help='comma separated names of the expressions to benchmark (default: all).')
+    parser.add_argument('-o', '--output', help='save the results as JSON here.')
+    parser.add_argument('-c', '--compare', help='compare with the results saved here.')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    sizes = [ int(size) for size in args.sizes.split(',') ]
+
+    results = []
+    for name in args.expressions.split(','):
+        build, generate = expressions[name]
+        for result in bench_expression(name, build, generate, sizes, args.repeat):
+            print('%(expression)-20s %(stage)-10s %(size)8d %(seconds)12.6f' % result)
+            results.append(result)
+
+    data = dict(python=sys.version, platform=platform.platform(), time=time.time(),
+                sizes=sizes, repeat=args.repeat, seed=args.seed, results=results)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            old = json.load(f)
+
+        print()
+        compare(old, data)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,189 +1,3337 @@
 #! /usr/bin/env python3
 
+import bisect
+import calendar
+import datetime as _datetime
+import ipaddress
+import mmap
+import os
 import re
 import sys
-import copy
+import threading
+import time
+import unicodedata
+import weakref
+from array import array
+from collections import deque, namedtuple, OrderedDict
 from functools import partial
+from itertools import chain
+
+
+# expression tree
+# a Dinant holds one of these nodes; nodes are never modified once built, so
+# subexpressions like digits can be shared by as many expressions as needed.
+# the tree is only flattened to a string once, by Dinant.__str__()
+
+# nodes are also interned (hash consing): building a node equal to one that
+# already exists returns the existing one, so any_of('+-') is stored only once
+# no matter how many expressions use it. children are built before their
+# parents, so they're already interned and can be compared by identity
+_interned = weakref.WeakValueDictionary()
+
+class _Interned(type):
+    def __call__(cls, *args, **kwargs):
+        node = super().__call__(*args, **kwargs)
+        key = (cls, ) + node.key()
+
+        try:
+            # no lock: if two threads build the same node at the same time, both
+            # get theirs and only one is interned, which is harmless
+            return _interned.setdefault(key, node)
+        except TypeError:
+            # unhashable type=
+            return node
+
+
+class _Node(metaclass=_Interned):
+    __slots__ = ('__weakref__', )
+    # whether a quantifier can be applied directly, without wrapping in (?:...)
+    atomic = False
+
+    def parts(self):
+        """Returns a sequence of strings and subnodes that, flattened in order,
+        give the regexp for this node."""
+        raise NotImplementedError
+
+    def key(self):
+        """Returns what makes this node different from others of its class."""
+        raise NotImplementedError
+
+
+class _Cached(_Node):
+    """Base for nodes that remember their flattened string. Shared subexpressions
+    like float are then flattened only once, no matter how many expressions use
+    them. _Concat is not cached, or long expressions would keep a copy of each of
+    their prefixes."""
+    __slots__ = ('string', )
+
+    def __init__(self):
+        self.string = None
+
+
+def _is_atom(s):
+    # anchors can't be repeated
+    return ( (len(s) == 1 and s not in '^$|()') or
+             (len(s) == 2 and s[0] == '\\' and s[1] not in 'AZbB') )
+
+
+class _Text(_Node):
+    """Literal text, escaped."""
+    __slots__ = ('text', 'string')
+
+    def __init__(self, text):
+        self.text = text
+        self.string = re.escape(text)
+
+    @property
+    def atomic(self):
+        return _is_atom(self.string)
+
+    def parts(self):
+        return (self.string, )
+
+    def key(self):
+        return (self.text, )
+
+    def __repr__(self):
+        return '_Text(%r)' % self.text
+
+
+class _Regexp(_Node):
+    """A raw regexp, not escaped."""
+    __slots__ = ('string', )
+
+    def __init__(self, string):
+        self.string = string
+
+    @property
+    def atomic(self):
+        return _is_atom(self.string)
+
+    def parts(self):
+        return (self.string, )
+
+    def key(self):
+        return (self.string, )
+
+    def __repr__(self):
+        return '_Regexp(%r)' % self.string
+
+
+class _Class(_Node):
+    __slots__ = ('spec', 'negated')
+    atomic = True
+
+    def __init__(self, spec, negated=False):
+        self.spec = spec
+        self.negated = negated
+
+    def parts(self):
+        return ('[^' if self.negated else '[', self.spec, ']')
+
+    def key(self):
+        return (self.spec, self.negated)
+
+    def __repr__(self):
+        return '_Class(%r, negated=%r)' % (self.spec, self.negated)
+
+
+class _Concat(_Node):
+    # always built with two items by Dinant.__add__(), so adding is O(1);
+    # long expressions become left leaning trees, that's why nothing here recurses
+    __slots__ = ('items', )
+
+    def __init__(self, items):
+        self.items = tuple(items)
+
+    def parts(self):
+        return self.items
+
+    def key(self):
+        return self.items
+
+    def __repr__(self):
+        return '_Concat(%r)' % (self.items, )
+
+
+class _Group(_Cached):
+    # kind is the opening of the group: '(', '(?:', '(?>', '(?=', '(?!', '(?<=', '(?<!'
+    # named captures have kind '(?P<' and a name
+    # captures can have a type, a function that converts the captured string
+    __slots__ = ('kind', 'child', 'name', 'type')
+    atomic = True
+
+    def __init__(self, kind, child, name=None, type=None):
+        super().__init__()
+        self.kind = kind
+        self.child = child
+        self.name = name
+        self.type = type
+
+    def parts(self):
+        if self.name is not None:
+            return ('(?P<', self.name, '>', self.child, ')')
+        else:
+            return (self.kind, self.child, ')')
+
+    def key(self):
+        return (self.kind, self.child, self.name, self.type)
+
+    def __repr__(self):
+        result = '_Group(%r, %r' % (self.kind, self.child)
+        if self.name is not None:
+            result += ', name=%r' % self.name
+        if self.type is not None:
+            result += ', type=%r' % self.type
+
+        return result + ')'
+
+
+class _Repeat(_Cached):
+    # max is None for no upper bound
+    # possessive ones never give back what they matched, see atomic()
+    __slots__ = ('child', 'min', 'max', 'greedy', 'possessive')
+
+    def __init__(self, child, min, max, greedy=True, possessive=False):
+        super().__init__()
+        if possessive and not greedy:
+            raise ValueError("a quantifier can't be both non greedy and possessive")
+
+        self.child = child
+        self.min = min
+        self.max = max
+        self.greedy = greedy
+        self.possessive = possessive
+
+    def quantifier(self):
+        m, n = self.min, self.max
+
+        if (m, n) == (0, None):
+            result = '*'
+        elif (m, n) == (1, None):
+            result = '+'
+        elif (m, n) == (0, 1):
+            result = '?'
+        elif m == n:
+            result = '{%d}' % m
+        else:
+            result = '{%s,%s}' % ('' if m == 0 else m, '' if n is None else n)
+
+        if self.possessive:
+            result += '+'
+        elif not self.greedy:
+            result += '?'
+
+        return result
+
+    def parts(self):
+        if self.child.atomic:
+            return (self.child, self.quantifier())
+        else:
+            return ('(?:', self.child, ')', self.quantifier())
+
+    def key(self):
+        return (self.child, self.min, self.max, self.greedy, self.possessive)
+
+    def __repr__(self):
+        return ( '_Repeat(%r, %r, %r, greedy=%r, possessive=%r)' %
+                 (self.child, self.min, self.max, self.greedy, self.possessive) )
+
+
+class _Backref(_Node):
+    __slots__ = ('name', )
+    atomic = True
+
+    def __init__(self, name):
+        self.name = name
+
+    def parts(self):
+        return ('(?P=', self.name, ')')
+
+    def key(self):
+        return (self.name, )
+
+    def __repr__(self):
+        return '_Backref(%r)' % self.name
+
+
+class _Either(_Cached):
+    # the bare alternation, either() wraps it in a group
+    __slots__ = ('branches', )
+
+    def __init__(self, branches):
+        super().__init__()
+        self.branches = tuple(branches)
+
+    def parts(self):
+        result = []
+        for branch in self.branches:
+            result.append(branch)
+            result.append('|')
+
+        return result[:-1]
+
+    def key(self):
+        return self.branches
+
+    def __repr__(self):
+        return '_Either(%r)' % (self.branches, )
+
+
+class _Done:
+    """Marks the end of a cached node's parts in _flatten()'s stack."""
+    __slots__ = ('node', 'start')
+
+    def __init__(self, node, start):
+        self.node = node
+        self.start = start
+
+
+def _flatten(node):
+    """Converts a tree into its regexp."""
+    # no recursion, see _Concat
+    result = []
+    stack = [ node ]
+
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            result.append(item)
+        elif isinstance(item, _Done):
+            # collapse the node's parts and remember them
+            string = ''.join(result[item.start:])
+            del result[item.start:]
+            result.append(string)
+            item.node.string = string
+        elif isinstance(item, _Cached):
+            if item.string is None:
+                stack.append(_Done(item, len(result)))
+                stack.extend(reversed(item.parts()))
+            else:
+                result.append(item.string)
+        else:
+            stack.extend(reversed(item.parts()))
+
+    return ''.join(result)
+
+
+def _concat_items(node):
+    """Returns the top level subexpressions of a concatenation, in order."""
+    result = []
+    stack = [ node ]
+
+    while stack:
+        item = stack.pop()
+        if isinstance(item, _Concat):
+            stack.extend(reversed(item.items))
+        else:
+            result.append(item)
+
+    return result
+
+
+def _regexp_groups(string):
+    """Counts the capturing groups in a raw regexp."""
+    try:
+        return re.compile(string).groups
+    except re.error:
+        # not a complete regexp
+        return len(re.findall(r'(?<!\\)\((?:\?P<|(?!\?))', string))
+
+
+def _converters(node):
+    """Returns the index and type of the typed captures of the tree."""
+    result = []
+    index = 0
+    stack = [ node ]
+
+    # capturing groups are numbered in the order they open
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            continue
+        elif isinstance(item, _Regexp):
+            index += _regexp_groups(item.string)
+        elif isinstance(item, _Group) and item.kind in ('(', '(?P<'):
+            index += 1
+            if item.type is not None:
+                result.append((index, item.type))
+
+        if not isinstance(item, (_Text, _Regexp, _Class, _Backref)):
+            stack.extend(reversed(item.parts()))
+
+    return tuple(result)
+
+
+def _optional_groups(node):
+    """Returns the indexes of the capturing groups of the tree that can be empty
+    or not take part in a match, numbered like in _converters()."""
+    result = set()
+    index = 0
+    done = {}
+    stack = [ (node, False) ]
+
+    while stack:
+        item, optional = stack.pop()
+        if isinstance(item, str):
+            continue
+        elif isinstance(item, _Regexp):
+            index += _regexp_groups(item.string)
+        elif isinstance(item, _Group) and item.kind in ('(', '(?P<'):
+            index += 1
+            if optional or _info(item.child, done).nullable:
+                result.add(index)
+
+        # what's inside these can be skipped
+        if ( isinstance(item, _Either) and len(item.branches) > 1 or
+             isinstance(item, _Repeat) and item.min == 0 or
+             isinstance(item, _Group) and item.kind in ('(?!', '(?<!') ):
+            optional = True
+
+        if not isinstance(item, (_Text, _Regexp, _Class, _Backref)):
+            stack.extend((part, optional) for part in reversed(item.parts()))
+
+    return result
+
+
+def _decoding(convert):
+    """Wraps convert so it can also be used with bytes."""
+    def decode(value):
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+
+        return convert(value)
+
+    return decode
+
+
+def _type(type, regexp):
+    """Resolves the type of a capture: either a function, or the type of a
+    expression, ie, integer(capture='foo', type=int) converts it to a Python int;
+    True means regexp's own."""
+    if type is True:
+        if regexp is None:
+            raise ValueError('type=True needs an expression')
+
+        type = regexp
+
+    if isinstance(type, Dinant):
+        if type.type is None:
+            raise ValueError('%r has no type' % (type, ))
+
+        return type.type
+
+    return type
+
+
+def _flatten_bytes(node, encoding='utf-8'):
+    """Converts a tree into a bytes regexp."""
+    result = []
+    stack = [ node ]
+
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            result.append(item.encode(encoding))
+        elif isinstance(item, _Class):
+            result.append(_class_bytes(item))
+        elif ( isinstance(item, _Repeat) and isinstance(item.child, (_Text, _Regexp)) and
+               not item.child.string.isascii() ):
+            # é is one character but two bytes
+            stack.extend(reversed(('(?:', item.child, ')', item.quantifier())))
+        else:
+            stack.extend(reversed(item.parts()))
+
+    return b''.join(result)
+
+
+# what \d, \s and \w match in bytes regexps
+_ascii_escapes = { '\\d': ((0x30, 0x39), ), '\\s': ((0x09, 0x0d), (0x20, 0x20)),
+                   '\\w': ((0x30, 0x39), (0x41, 0x5a), (0x5f, 0x5f), (0x61, 0x7a)) }
+
+def _class_bytes(node):
+    """Returns the bytes regexp of a class. Classes with non ASCII characters, which
+    are several bytes each, become an alternation of sequences of byte ranges
+    that match their UTF-8 encodings."""
+    spec = node.spec
+    if spec.isascii() and '\\u' not in spec and '\\U' not in spec:
+        return b''.join(part.encode() for part in node.parts())
+
+    negated = node.negated
+    if spec.startswith('^'):
+        if negated:
+            spec = '\\' + spec
+        else:
+            # any_of('^é')
+            negated = True
+            spec = spec[1:]
+
+    try:
+        chars = _parse_class(spec)
+    except ValueError:
+        raise ValueError("character class %r can't be matched as bytes" % node.spec)
+
+    ranges = list(chars.ranges)
+    for escape in chars.escapes:
+        if escape[1].isupper():
+            ranges.extend(_complement_ranges(_ascii_escapes[escape.lower()]))
+        else:
+            ranges.extend(_ascii_escapes[escape])
+
+    ranges = _merge_ranges(ranges)
+    if negated:
+        ranges = _complement_ranges(ranges)
+
+    # surrogates can't be encoded
+    ranges = (_char_class(ranges) - _char_class(((0xd800, 0xdfff), ))).ranges
+
+    ascii = []
+    branches = []
+    for start, end in ranges:
+        for sequence in _utf8_sequences(start, end):
+            if len(sequence) == 1:
+                ascii.append(_byte_range(*sequence[0]))
+            else:
+                branches.append(b''.join(b'[' + _byte_range(low, high) + b']' if low != high else
+                                         _byte_range(low, high) for low, high in sequence))
+
+    if len(ascii) > 0:
+        branches.insert(0, b'[' + b''.join(ascii) + b']')
+    if len(branches) == 0:
+        # nothing matches
+        branches.append(b'[^\\s\\S]')
+
+    return b'(?:' + b'|'.join(branches) + b')'
+
+
+def _byte_range(low, high):
+    if low == high:
+        return b'\\x%02x' % low
+    else:
+        return b'\\x%02x-\\x%02x' % (low, high)
+
+
+def _utf8_sequences(start, end):
+    """Splits the code points from start to end into lists of byte ranges, one for
+    each byte of their UTF-8 encodings, like [ (0xc3, 0xc3), (0xa0, 0xbf) ]."""
+    # first by the length of their encodings
+    for low, high in ((0, 0x7f), (0x80, 0x7ff), (0x800, 0xffff), (0x10000, sys.maxunicode)):
+        if start > high or end < low:
+            continue
+
+        a, b = max(start, low), min(end, high)
+        # then until all the bytes but the first one cover their whole range
+        stack = [ (a, b) ]
+        while stack:
+            a, b = stack.pop()
+            for i in range(1, len(chr(a).encode('utf-8', 'surrogatepass'))):
+                mask = (1 << (6 * i)) - 1
+                if a & ~mask != b & ~mask:
+                    if a & mask != 0:
+                        stack.extend([ ((a | mask) + 1, b), (a, a | mask) ])
+                        break
+                    if b & mask != mask:
+                        stack.extend([ (b & ~mask, b), (a, (b & ~mask) - 1) ])
+                        break
+            else:
+                yield list(zip(chr(a).encode('utf-8', 'surrogatepass'),
+                               chr(b).encode('utf-8', 'surrogatepass')))
+
+
+# flags
+IGNORECASE = re.IGNORECASE
+MULTILINE = re.MULTILINE
+DOTALL = re.DOTALL
+ASCII = re.ASCII
+
+__flag_letters = (
+    (IGNORECASE, 'i'),
+    (MULTILINE, 'm'),
+    (DOTALL, 's'),
+    (ASCII, 'a'),
+    )
+
+def _flags_group(flags):
+    """Returns the opening of a group that applies flags only to its contents."""
+    letters = ''
+    for flag, letter in __flag_letters:
+        if flags & flag:
+            letters += letter
+            flags &= ~flag
+
+    if flags != 0:
+        raise ValueError('unsupported flags: %r' % re.RegexFlag(flags))
+
+    return '(?%s:' % letters
+
+
+def _group_flags(kind):
+    """The opposite of _flags_group()."""
+    flags = 0
+    for flag, letter in __flag_letters:
+        if letter in kind:
+            flags |= flag
+
+    return flags
+
+
+def _node(other, escape=True):
+    if isinstance(other, _Node):
+        return other
+    elif isinstance(other, str):
+        if escape:
+            return _Text(other)
+        else:
+            return _Regexp(other)
+    elif isinstance(other, CharClass):
+        return other.node
+    elif other.flags != 0:
+        # as a subexpression, its flags only apply to it
+        return _Group(_flags_group(other.flags), other.node)
+    else:
+        return other.node
+
+
+# character classes
+# sets of characters, kept as sorted, disjoint and non adjacent ranges of code
+# points, so they can be combined and written with the fewest ranges possible.
+# \d, \s, \w and their negations are kept as they are, because what they match
+# depends on the flags and on whether it's str or bytes; they're expanded (to
+# what they match in str) only for intersections, differences and complements
+_class_escapes = ('\\d', '\\D', '\\s', '\\S', '\\w', '\\W')
+_class_codes = dict(a='\a', b='\b', f='\f', n='\n', r='\r', t='\t', v='\v')
+_class_names = { char: name for name, char in _class_codes.items() if name not in 'ab' }
+# category or script, or escape -> ranges
+_unicode_ranges = {}
+_unicode_lock = threading.Lock()
+_categories = ( 'Lu', 'Ll', 'Lt', 'Lm', 'Lo', 'Mn', 'Mc', 'Me', 'Nd', 'Nl', 'No', 'Pc', 'Pd', 'Ps',
+                'Pe', 'Pi', 'Pf', 'Po', 'Sm', 'Sc', 'Sk', 'So', 'Zs', 'Zl', 'Zp', 'Cc', 'Cf', 'Cs',
+                'Co', 'Cn' )
+# scripts whose characters' names don't start with the script's name
+_script_prefixes = dict(Han=('CJK UNIFIED IDEOGRAPH-', 'CJK COMPATIBILITY IDEOGRAPH-', 'CJK RADICAL ',
+                             'KANGXI RADICAL '))
+# and the ones that can't be told by the names at all
+_unnamed_scripts = ('Common', 'Inherited', 'Unknown')
+
+def _merge_ranges(ranges):
+    result = []
+
+    for start, end in sorted(ranges):
+        if len(result) > 0 and start <= result[-1][1] + 1:
+            if end > result[-1][1]:
+                result[-1] = (result[-1][0], end)
+        else:
+            result.append((start, end))
+
+    return tuple(result)
+
+
+def _complement_ranges(ranges):
+    result = []
+    start = 0
+
+    for low, high in ranges:
+        if low > start:
+            result.append((start, low - 1))
+
+        start = high + 1
+
+    if start <= sys.maxunicode:
+        result.append((start, sys.maxunicode))
+
+    return tuple(result)
+
+
+def _predicate_ranges(predicate):
+    """Returns the ranges of the characters for which predicate() is true. It goes
+    through all of Unicode, so the results are cached."""
+    result = []
+    start = None
+
+    for code in range(sys.maxunicode + 1):
+        if predicate(chr(code)):
+            if start is None:
+                start = code
+        elif start is not None:
+            result.append((start, code - 1))
+            start = None
+
+    if start is not None:
+        result.append((start, sys.maxunicode))
+
+    return tuple(result)
+
+
+def _category_ranges():
+    """Returns a dict with the ranges of each of the (two letter) Unicode
+    categories, all found in a single pass through Unicode."""
+    result = {}
+    start = 0
+    previous = unicodedata.category(chr(0))
+
+    for code in range(1, sys.maxunicode + 2):
+        category = unicodedata.category(chr(code)) if code <= sys.maxunicode else None
+        if category != previous:
+            result.setdefault(previous, []).append((start, code - 1))
+            start = code
+            previous = category
+
+    return { category: tuple(result.get(category, ())) for category in _categories }
+
+
+def _unicode_property(name):
+    """Returns the ranges of the characters in the Unicode category (like L or
+    Lu) or script (like Greek, or Old_Italic) name. The stdlib has no scripts, so
+    they're the characters whose names start with it, like GREEK SMALL LETTER
+    ALPHA, or with the prefixes in _script_prefixes; digits and punctuation that
+    are common to several are not included, and _unnamed_scripts are not
+    supported."""
+    with _unicode_lock:
+        if name in _unicode_ranges:
+            return _unicode_ranges[name]
+
+    # these go through all of Unicode, so not while holding the lock; two threads
+    # can look the same one up at the same time, which is harmless
+    if name in _categories or name in (category[0] for category in _categories):
+        if _categories[0] not in _unicode_ranges:
+            found = _category_ranges()
+            with _unicode_lock:
+                for category, ranges in found.items():
+                    _unicode_ranges.setdefault(category, ranges)
+
+        result = _merge_ranges(chain.from_iterable(_unicode_ranges[category] for category in _categories
+                                                   if category.startswith(name)))
+    elif name in _unnamed_scripts:
+        raise ValueError("Unicode script %r is not supported, its characters can't be told by their "
+                         "names" % name)
+    else:
+        prefixes = _script_prefixes.get(name, (name.replace('_', ' ').upper() + ' ', ))
+        result = _predicate_ranges(lambda char: unicodedata.name(char, '').startswith(prefixes))
+        if len(result) == 0:
+            raise ValueError('unknown Unicode script %r; %s are not supported' %
+                             (name, ', '.join(_unnamed_scripts)))
+
+    with _unicode_lock:
+        return _unicode_ranges.setdefault(name, result)
+
+
+def _escape_ranges(escape):
+    """Returns the ranges of what escape, like \\d, matches in str."""
+    with _unicode_lock:
+        if escape in _unicode_ranges:
+            return _unicode_ranges[escape]
+
+    # the same as re does; out of the lock, like in _unicode_property()
+    predicate = dict(d=str.isdecimal, s=str.isspace,
+                     w=lambda char: char.isalnum() or char == '_')[escape[1].lower()]
+    ranges = _predicate_ranges(predicate)
+    if escape[1].isupper():
+        ranges = _complement_ranges(ranges)
+
+    with _unicode_lock:
+        return _unicode_ranges.setdefault(escape, ranges)
+
+
+def _class_token(spec, i):
+    """Returns the character at spec[i], as a code point, or a CharClass for things
+    like \\d, and where the next one starts."""
+    char = spec[i]
+    if char != '\\':
+        if char == ']' and i > 0:
+            # unless it's the first one, it would end the class
+            raise ValueError('unescaped ] in %r' % spec)
+
+        return ord(char), i + 1
+
+    if i + 1 == len(spec):
+        raise ValueError('bad escape at the end of %r' % spec)
+
+    char = spec[i + 1]
+    if spec[i:i + 2] in _class_escapes:
+        return _char_class((), (spec[i:i + 2], )), i + 2
+    elif char in 'pP':
+        end = spec.find('}', i)
+        if spec[i + 2:i + 3] != '{' or end == -1:
+            raise ValueError('bad property in %r' % spec)
+
+        result = _char_class(_unicode_property(spec[i + 3:end]))
+        if char == 'P':
+            result = ~result
+
+        return result, end + 1
+    elif char in 'xuU':
+        length = dict(x=2, u=4, U=8)[char]
+        digits = spec[i + 2:i + 2 + length]
+        if len(digits) != length or any(digit not in '0123456789abcdefABCDEF' for digit in digits):
+            raise ValueError('bad escape in %r' % spec)
+
+        return _int(digits, 16), i + 2 + length
+    elif char in _class_codes:
+        return ord(_class_codes[char]), i + 2
+    elif char.isalnum():
+        # octals, bad escapes
+        raise ValueError("can't handle \\%s in %r" % (char, spec))
+    else:
+        return ord(char), i + 2
+
+
+def _parse_class(spec):
+    """Parses the inside of a character class, like 'a-z\\d', into a CharClass;
+    raises ValueError if it can't."""
+    negated = spec.startswith('^')
+    if negated:
+        spec = spec[1:]
+
+    ranges = []
+    escapes = []
+    i = 0
+
+    while i < len(spec):
+        token, i = _class_token(spec, i)
+
+        if isinstance(token, CharClass):
+            ranges.extend(token.ranges)
+            escapes.extend(token.escapes)
+        elif spec[i:i + 1] == '-' and i + 1 < len(spec):
+            end, i = _class_token(spec, i + 1)
+            if isinstance(end, CharClass) or end < token:
+                raise ValueError('bad range in %r' % spec)
+
+            ranges.append((token, end))
+        else:
+            ranges.append((token, token))
+
+    result = _char_class(ranges, escapes)
+    if negated:
+        result = ~result
+
+    return result
+
+
+def _char_class(ranges=(), escapes=()):
+    result = CharClass.__new__(CharClass)
+    result.ranges = _merge_ranges(ranges)
+    result.escapes = tuple(escape for escape in _class_escapes if escape in escapes)
+
+    return result
+
+
+def _class_char(code):
+    """Returns how the character with code point code is written in a class."""
+    char = chr(code)
+
+    if char in '\\]^-[':
+        return '\\' + char
+    elif char in _class_names:
+        return '\\' + _class_names[char]
+    elif char.isprintable():
+        return char
+    elif code < 0x80:
+        return '\\x%02x' % code
+    elif code < 0x10000:
+        # not \x, which in bytes would be a single byte
+        return '\\u%04x' % code
+    else:
+        return '\\U%08x' % code
+
+
+def _format_ranges(ranges):
+    result = []
+
+    for start, end in ranges:
+        result.append(_class_char(start))
+        if end == start + 1:
+            result.append(_class_char(end))
+        elif end > start:
+            result.append('-' + _class_char(end))
+
+    return ''.join(result)
+
+
+class CharClass:
+    """A set of characters, written as the shortest character class that matches
+    them. spec is like any_of()'s, plus \\p{name} (and \\P{name} for the opposite)
+    for the characters in a Unicode category, like L or Lu, or script, like Greek;
+    see _unicode_property(). They're combined with | (union), & (intersection), -
+    (difference) and ~ (complement), with each other or with specs, and can be used
+    wherever an expression can."""
+    __slots__ = ('ranges', 'escapes', 'cached')
+
+    def __init__(self, spec=''):
+        parsed = _parse_class(spec)
+        self.ranges = parsed.ranges
+        self.escapes = parsed.escapes
+
+    def expanded(self):
+        """Returns the ranges of all its characters, with escapes expanded."""
+        ranges = list(self.ranges)
+        for escape in self.escapes:
+            ranges.extend(_escape_ranges(escape))
+
+        return _merge_ranges(ranges)
+
+    @property
+    def node(self):
+        try:
+            return self.cached
+        except AttributeError:
+            pass
+
+        spec = _format_ranges(self.ranges) + ''.join(self.escapes)
+
+        # [] and [^] are not valid
+        if spec == '':
+            node = _Class('\\s\\S', negated=True)
+        elif self.ranges == ((0, sys.maxunicode), ):
+            node = _Class('\\s\\S')
+        elif len(self.escapes) > 0:
+            node = _Class(spec)
+        else:
+            negated = _format_ranges(_complement_ranges(self.ranges))
+            node = _Class(negated, negated=True) if len(negated) < len(spec) else _Class(spec)
+
+        self.cached = node
+
+        return node
+
+    def __or__(self, other):
+        other = _as_class(other)
+        if other is None:
+            return NotImplemented
+
+        return _char_class(self.ranges + other.ranges, self.escapes + other.escapes)
+
+    __ror__ = __or__
+
+    def __and__(self, other):
+        other = _as_class(other)
+        if other is None:
+            return NotImplemented
+
+        return ~(~self | ~other)
+
+    __rand__ = __and__
+
+    def __sub__(self, other):
+        other = _as_class(other)
+        if other is None:
+            return NotImplemented
+
+        return self & ~other
+
+    def __rsub__(self, other):
+        other = _as_class(other)
+        if other is None:
+            return NotImplemented
+
+        return other - self
+
+    def __invert__(self):
+        return _char_class(_complement_ranges(self.expanded()))
+
+    def __contains__(self, char):
+        code = ord(char)
+        index = bisect.bisect(self.ranges, (code, sys.maxunicode))
+        if index > 0 and self.ranges[index - 1][1] >= code:
+            return True
+
+        return any(re.match(escape, char) is not None for escape in self.escapes)
+
+    def __add__(self, other):
+        return Dinant(self) + other
+
+    def __radd__(self, other):
+        return other + Dinant(self)
+
+    def __eq__(self, other):
+        if not isinstance(other, CharClass):
+            return NotImplemented
+
+        return self.ranges == other.ranges and self.escapes == other.escapes
+
+    def __hash__(self):
+        return hash((self.ranges, self.escapes))
+
+    def __str__(self):
+        return _flatten(self.node)
+
+    def __repr__(self):
+        return 'CharClass(%r)' % (_format_ranges(self.ranges) + ''.join(self.escapes))
+
+
+def _as_class(other):
+    if isinstance(other, CharClass):
+        return other
+    elif isinstance(other, str):
+        return CharClass(other)
+    else:
+        return None
+
+
+def _node_class(node):
+    """Returns the CharClass of node if it matches exactly one character, or None.
+    Negated classes with escapes are not expanded, see above."""
+    if isinstance(node, _Text) and len(node.text) == 1 and node.text.isascii():
+        # é is two bytes, so it can't go in a class and be matched as bytes
+        return _char_class(((ord(node.text), ord(node.text)), ))
+    elif isinstance(node, _Regexp) and node.string in _class_escapes:
+        return _char_class((), (node.string, ))
+    elif isinstance(node, _Class):
+        spec = ('^' if node.negated else '') + node.spec
+        if spec.startswith('^') and any(escape in spec for escape in _class_escapes):
+            return None
+
+        try:
+            return _parse_class(spec)
+        except ValueError:
+            pass
+
+    return None
+
+
+def _merge_classes(branches):
+    """Merges the consecutive branches of an alternation that match exactly one
+    character into a single class; which one of them matches makes no difference."""
+    result = []
+    # the branches and their classes
+    run = []
+
+    for branch in list(branches) + [ None ]:
+        found = _node_class(branch) if branch is not None else None
+        if found is not None:
+            run.append((branch, found))
+            continue
+
+        if len(run) == 1:
+            result.append(run[0][0])
+        elif len(run) > 1:
+            classes = [ found for single, found in run ]
+            result.append(_char_class([ item for found in classes for item in found.ranges ],
+                                      [ escape for found in classes for escape in found.escapes ]).node)
+
+        run = []
+        if branch is not None:
+            result.append(branch)
+
+    return result
+
+
+# simplification
+# the tree is built as the user wrote it, which produces things like (?:[a-z])+
+# these rewrite it into an equivalent but smaller tree before compiling it
+def _is_non_capturing(node):
+    return isinstance(node, _Group) and node.kind == '(?:'
+
+
+def _has_alternation(node):
+    """Whether node's regexp can have a | outside of any group, so it needs one
+    around it to be part of something else. Raw regexps can have anything."""
+    if isinstance(node, _Either):
+        return True
+    elif isinstance(node, _Regexp):
+        return '|' in node.string
+    elif isinstance(node, _Concat):
+        return any(_has_alternation(item) for item in node.items)
+    else:
+        return False
+
+
+def _leading_text(items):
+    if len(items) > 0 and isinstance(items[0], _Text):
+        return items[0].text
+    else:
+        return None
+
+
+def _concat(items):
+    """Builds a flat concatenation, merging adjacent literals."""
+    result = []
+
+    for item in items:
+        if isinstance(item, _Text) and item.text == '':
+            continue
+        elif len(result) > 0 and isinstance(item, _Text) and isinstance(result[-1], _Text):
+            result[-1] = _Text(result[-1].text + item.text)
+        else:
+            result.append(item)
+
+    if len(result) == 0:
+        return _Text('')
+    elif len(result) == 1:
+        return result[0]
+    else:
+        return _Concat(result)
+
+
+def _simplify_either(branches):
+    # (?:a|(?:b|c)) is a|b|c
+    flat = []
+    for branch in branches:
+        if _is_non_capturing(branch) and isinstance(branch.child, _Either):
+            flat.extend(branch.child.branches)
+        else:
+            flat.append(branch)
+
+    # single characters become a class
+    flat = _merge_classes(flat)
+
+    # factor the literal prefixes of consecutive branches:
+    # abc|abd|e is ab(?:c|d)|e
+    # this only works for literals, because they can match only in one way,
+    # otherwise the order in which alternatives are tried would change
+    result = []
+    i = 0
+    while i < len(flat):
+        items = _concat_items(flat[i])
+        prefix = _leading_text(items)
+        j = i + 1
+
+        if prefix is not None:
+            while j < len(flat):
+                other = _leading_text(_concat_items(flat[j]))
+                if other is None:
+                    break
+
+                common = os.path.commonprefix([ prefix, other ])
+                if common == '':
+                    break
+
+                prefix = common
+                j += 1
+
+        if j - i > 1:
+            rests = []
+            for branch in flat[i:j]:
+                items = _concat_items(branch)
+                rests.append(_concat([ _Text(items[0].text[len(prefix):]) ] + items[1:]))
+
+            rest = _simplify_either(rests)
+            if isinstance(rest, _Either):
+                rest = _Group('(?:', rest)
+
+            result.append(_concat([ _Text(prefix), rest ]))
+        else:
+            result.append(flat[i])
+
+        i = j
+
+    if len(result) == 1:
+        return result[0]
+    else:
+        return _Either(result)
+
+
+def _simplify(node, done=None):
+    if done is None:
+        # subexpressions are shared, so simplify them only once
+        done = {}
+
+    key = id(node)
+    if key in done:
+        return done[key]
+
+    if isinstance(node, _Concat):
+        items = []
+        for item in _concat_items(node):
+            item = _simplify(item, done)
+
+            if isinstance(item, _Concat):
+                items.extend(item.items)
+            else:
+                items.append(item)
+
+        result = _concat(items)
+
+    elif isinstance(node, _Group):
+        child = _simplify(node.child, done)
+
+        if node.kind == '(?:' and not _has_alternation(child):
+            # the group is only needed for alternations; _Repeat adds it back
+            # if the child is not atomic
+            result = child
+        else:
+            result = _Group(node.kind, child, node.name, node.type)
+
+    elif isinstance(node, _Repeat):
+        child = _simplify(node.child, done)
+        if _is_non_capturing(child):
+            child = child.child
+
+        if node.min == 1 and node.max == 1:
+            if node.possessive:
+                # (?:ab){1}+ is (?>ab)
+                result = _Group('(?>', child)
+            elif _has_alternation(child):
+                # x(?:ab|cd){1} is x(?:ab|cd), not xab|cd
+                result = _Group('(?:', child)
+            else:
+                result = child
+        elif ( (node.min, node.max) == (0, 1) and isinstance(child, _Repeat) and
+               child.min in (0, 1) and child.max is None and child.greedy == node.greedy and
+               child.possessive == node.possessive ):
+            # (?:a+)? and (?:a*)? are a*
+            result = _Repeat(child.child, 0, None, node.greedy, node.possessive)
+        else:
+            result = _Repeat(child, node.min, node.max, node.greedy, node.possessive)
+
+    elif isinstance(node, _Either):
+        result = _simplify_either([ _simplify(branch, done) for branch in node.branches ])
+
+    else:
+        result = node
+
+    done[key] = result
+
+    return result
+
+
+# prefilter
+# most lines don't match, and most expressions have some text that all their
+# matches contain; looking for it with `in` is much faster than running the regexp
+def _is_literal(regexp):
+    """Whether the raw regexp has no special characters, so it's just text."""
+    return not any(char in regexp for char in '.^$*+?{}[]\\|()')
+
+
+# (?i) or (?i:...); flags inside raw regexps can make the texts case insensitive
+_inline_flags = re.compile(r'\(\?[aiLmsux-]+[:)]')
+
+def _balanced(regexp):
+    """Whether the raw regexp closes all the groups it opens, so it's not a piece
+    of a group split among several regexp()s."""
+    depth = 0
+    escaped = in_class = False
+
+    for char in regexp:
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth < 0:
+                return False
+
+    return depth == 0
+
+
+def _opaque(node):
+    """Whether the raw regexp node can change what the rest of the tree means:
+    inline flags, alternatives or pieces of groups split among several regexp()s."""
+    return ( isinstance(node, _Regexp) and
+             (_inline_flags.search(node.string) is not None or _has_alternation(node) or
+              not _balanced(node.string)) )
+
+def _required_literals(node, limit=3):
+    """Returns up to limit of the longest texts that any match of the (simplified)
+    node contains, longest first."""
+    if any(_opaque(item) for item in _walk(node)):
+        return ()
+
+    found = set()
+    stack = [ node ]
+
+    while stack:
+        item = stack.pop()
+
+        if isinstance(item, _Text):
+            found.add(item.text)
+        elif isinstance(item, _Regexp) and _is_literal(item.string):
+            found.add(item.string)
+        elif isinstance(item, _Concat):
+            stack.extend(_concat_items(item))
+        elif isinstance(item, _Group):
+            # not the negative lookarounds, nor case insensitive parts
+            if not (item.kind in ('(?!', '(?<!') or item.kind[:2] == '(?' and 'i' in item.kind):
+                stack.append(item.child)
+        elif isinstance(item, _Repeat) and item.min > 0:
+            stack.append(item.child)
+        # alternatives, classes and other regexps can match different texts
+
+    found.discard('')
+
+    return tuple(sorted(found, key=len, reverse=True)[:limit])
+
+
+def _prefiltered(method, literals):
+    """Returns a function that calls method(s) only if s contains all the literals."""
+    if len(literals) == 0:
+        return method
+
+    def prefiltered(s):
+        for literal in literals:
+            if literal not in s:
+                return None
+
+        return method(s)
+
+    return prefiltered
+
+
+def _missing(literals, s):
+    """Whether s lacks any of the literals, so it can't match."""
+    for literal in literals:
+        if literal not in s:
+            return True
+
+    return False
+
+
+# tries
+# an alternation of many literals is tried branch by branch at every position;
+# a trie of the same literals only looks at each character once
+def _trie(words, longest=False):
+    """Builds a trie of nested dicts; words end where there's a '' key. Returns
+    None if a word is a prefix of a later one, because the alternation would
+    match the shorter one and the trie the longer one, unless longest is True."""
+    root = {}
+
+    for word in words:
+        trie = root
+        for char in word:
+            if '' in trie and not longest:
+                return None
+
+            trie = trie.setdefault(char, {})
+
+        trie[''] = True
+
+    return root
+
+
+def _trie_node(trie):
+    """Converts a trie into a tree that matches the longest of its words."""
+    branches = []
+    chars = []
+
+    for char in sorted(key for key in trie if key != ''):
+        text = char
+        sub = trie[char]
+
+        # follow chains of single characters
+        while len(sub) == 1 and '' not in sub:
+            (char, sub), = sub.items()
+            text += char
+
+        if len(sub) == 1:
+            # only '' left, a leaf
+            if len(text) == 1:
+                chars.append(text)
+            else:
+                branches.append(_Text(text))
+        else:
+            rest = _trie_node(sub)
+            if isinstance(rest, _Either):
+                rest = _Group('(?:', rest)
+
+            branches.append(_concat([ _Text(text), rest ]))
+
+    # all branches start with a different character, so their order does not matter
+    if len(chars) == 1:
+        branches.append(_Text(chars[0]))
+    elif len(chars) > 1:
+        branches.append(_char_class([ (ord(char), ord(char)) for char in chars ]).node)
+
+    if len(branches) == 1:
+        result = branches[0]
+    else:
+        result = _Either(branches)
+
+    if '' in trie:
+        # a word ends here, the rest is optional; greedy, so longer words win
+        result = _Repeat(result, 0, 1)
+
+    return result
+
+
+# engines
+# re's engine backtracks, so some expressions take exponential time on some
+# strings (see Dinant.analyze()). the linear engine follows all the ways of
+# matching at the same time (a Pike VM), so it takes time proportional to the
+# length of the string times the size of the expression; but it's written in
+# Python, so it's much slower than re in the usual case. most lines don't match,
+# so those are first run through a DFA that is built as it's needed and only
+# tells whether there is a match.
+class _Unsupported(ValueError):
+    """Raised by engines that can't handle an expression."""
+
+
+# instructions
+# CHAR(test): consumes a character if test(character)
+# SPLIT(x, y): continues at both x and y, x first
+# JUMP(x)
+# SAVE(slot): remembers the position in a capture slot
+# ASSERT(anchor, (multiline, word)): continues if the anchor holds
+# UNLESS(test, x): continues at x if the next character does not pass test, or at
+#   the next instruction if it does; for possessive repeats of single characters
+# MATCH
+_CHAR, _SPLIT, _JUMP, _SAVE, _ASSERT, _UNLESS, _MATCH = range(7)
+
+# what the previous character was, for the anchors
+_START, _NEWLINE, _WORD, _OTHER = range(4)
+
+_anchors = ('^', '$', '\\A', '\\Z', '\\b', '\\B')
+__tests = {}
+
+def _test(atom, flags, binary):
+    """Returns a function that tells whether a character matches atom, a regexp
+    that matches exactly one character."""
+    key = (atom, flags, binary)
+    if key not in __tests:
+        if binary:
+            if not atom.isascii() or '\\u' in atom or '\\U' in atom:
+                raise _Unsupported("%r can't be matched as bytes one byte at a time" % atom)
+
+            atom = atom.encode()
+
+        __tests[key] = re.compile(atom, flags).fullmatch
+
+    return __tests[key]
+
+
+def _holds(anchor, options, previous, current, last):
+    """Whether anchor holds between the previous kind of character and the current
+    character (None at the end of the string); last tells if it's the last one."""
+    multiline, word, newline = options
+
+    if anchor == '^':
+        return previous == _START or multiline and previous == _NEWLINE
+    elif anchor == '$':
+        return current is None or current == newline and (multiline or last)
+    elif anchor == '\\A':
+        return previous == _START
+    elif anchor == '\\Z':
+        return current is None
+    else:
+        boundary = (previous == _WORD) != (current is not None and word(current) is not None)
+        return boundary if anchor == '\\b' else not boundary
+
+
+class _Program:
+    """The instructions for the linear engine."""
+    def __init__(self, node, flags, binary):
+        self.binary = binary
+        self.newline = b'\n' if binary else '\n'
+        self.code = []
+        self.groups = 0
+        self.groupindex = {}
+        # the tests for characters only care about these
+        self.char_flags = IGNORECASE | DOTALL | (0 if binary else ASCII)
+        # whether the kind of the previous character is needed
+        self.anchors = False
+
+        self.emit(_SAVE, 0)
+        self.compile(node, flags)
+        self.emit(_SAVE, 1)
+        self.emit(_MATCH)
+
+    def emit(self, op, a=None, b=None):
+        self.code.append([ op, a, b ])
+        return len(self.code) - 1
+
+    def char(self, atom, flags):
+        self.emit(_CHAR, _test(atom, flags & self.char_flags, self.binary))
+
+    def text(self, text, flags):
+        if flags & IGNORECASE:
+            for char in text:
+                self.char(re.escape(char), flags)
+        elif self.binary:
+            for byte in text.encode():
+                self.emit(_CHAR, bytes([ byte ]).__eq__)
+        else:
+            for char in text:
+                self.emit(_CHAR, char.__eq__)
+
+    def compile(self, node, flags):
+        if isinstance(node, _Concat):
+            for item in _concat_items(node):
+                self.compile(item, flags)
+
+        elif isinstance(node, _Text):
+            self.text(node.text, flags)
+
+        elif isinstance(node, _Class):
+            self.char(_flatten(node), flags)
+
+        elif isinstance(node, _Regexp):
+            if node.string in _anchors:
+                self.anchors = True
+                word = _test('\\w', flags & self.char_flags, self.binary)
+                self.emit(_ASSERT, node.string, (bool(flags & MULTILINE), word, self.newline))
+            elif node.atomic:
+                self.char(node.string, flags)
+            elif _is_literal(node.string):
+                self.text(node.string, flags)
+            else:
+                raise _Unsupported('the linear engine does not support %r' % node.string)
+
+        elif isinstance(node, _Group):
+            if node.kind in ('(', '(?P<'):
+                self.groups += 1
+                index = self.groups
+                if node.name is not None:
+                    self.groupindex[node.name] = index
+
+                self.emit(_SAVE, 2 * index)
+                self.compile(node.child, flags)
+                self.emit(_SAVE, 2 * index + 1)
+            elif node.kind == '(?:':
+                self.compile(node.child, flags)
+            elif node.kind.startswith('(?') and node.kind.endswith(':'):
+                self.compile(node.child, flags | _group_flags(node.kind))
+            else:
+                raise _Unsupported('the linear engine does not support %r groups' % node.kind)
+
+        elif isinstance(node, _Repeat):
+            self.repeat(node, flags)
+
+        elif isinstance(node, _Either):
+            jumps = []
+            for branch in node.branches[:-1]:
+                split = self.emit(_SPLIT, len(self.code) + 1)
+                self.compile(branch, flags)
+                jumps.append(self.emit(_JUMP))
+                self.code[split][2] = len(self.code)
+
+            self.compile(node.branches[-1], flags)
+            for jump in jumps:
+                self.code[jump][1] = len(self.code)
+
+        else:
+            raise _Unsupported('the linear engine does not support %r' % _flatten(node))
+
+    def repeat(self, node, flags):
+        if node.max != node.min and _info(node.child, {}).nullable:
+            # re stops repeating after an empty iteration, and keeps it in the
+            # captures; this one doesn't, so they can match differently
+            raise _Unsupported('the linear engine does not support repeats of expressions that can '
+                               'match the empty string')
+
+        groups = self.groups
+
+        def child():
+            # all the copies have the same groups
+            self.groups = groups
+            start = len(self.code)
+            self.compile(node.child, flags)
+
+            return start
+
+        if node.max == 0:
+            # nothing to match, but the groups still count
+            del self.code[child():]
+            return
+
+        for i in range(node.min):
+            child()
+
+        if node.possessive:
+            # only possessive repeats of one character are supported: they take
+            # characters as long as they match, which is the same as not exiting
+            # the loop while the next one matches
+            start = len(self.code)
+            child()
+            if len(self.code) != start + 1 or self.code[start][0] != _CHAR:
+                raise _Unsupported('the linear engine only supports possessive repeats of one character')
+
+            test = self.code.pop()[1]
+            exits = []
+
+            if node.max is None:
+                loop = self.emit(_UNLESS, test)
+                exits.append(loop)
+                self.emit(_CHAR, test)
+                self.emit(_JUMP, loop)
+            else:
+                for i in range(node.max - node.min):
+                    exits.append(self.emit(_UNLESS, test))
+                    self.emit(_CHAR, test)
+
+            for unless in exits:
+                self.code[unless][2] = len(self.code)
+
+            return
+
+        # a split for each optional copy; which side goes first decides greediness
+        splits = []
+        if node.max is None:
+            loop = self.emit(_SPLIT)
+            splits.append(loop)
+            child()
+            self.emit(_JUMP, loop)
+        else:
+            for i in range(node.max - node.min):
+                splits.append(self.emit(_SPLIT))
+                child()
+
+        end = len(self.code)
+        for split in splits:
+            if node.greedy:
+                self.code[split][1:] = [ split + 1, end ]
+            else:
+                self.code[split][1:] = [ end, split + 1 ]
+
+
+class _LinearPattern:
+    """Quacks like a compiled re.Pattern, but returns Match objects."""
+    # the DFA forgets everything when it gets this big
+    max_transitions = 10000
+
+    def __init__(self, expression, flags=0, binary=False):
+        self.pattern = bytes(expression) if binary else str(expression)
+        self.flags = flags
+        self.program = _Program(expression.node, flags, binary)
+        self.groups = self.program.groups
+        self.groupindex = self.program.groupindex
+        # (state, previous, current, last) -> (matched, next state), for matching
+        # and for searching
+        self.transitions = ({}, {})
+        # character -> kind
+        self.kinds = {}
+        self.word = _test('\\w', flags & self.program.char_flags, binary)
+
+    def __repr__(self):
+        return '_LinearPattern(%r, flags=%r)' % (self.pattern, self.flags)
+
+    def kind(self, char):
+        """Returns the kind of char, for the anchors."""
+        result = self.kinds.get(char, None)
+        if result is None:
+            if char == self.program.newline:
+                result = _NEWLINE
+            elif self.word(char):
+                result = _WORD
+            else:
+                result = _OTHER
+
+            self.kinds[char] = result
+
+        return result
+
+    def context(self, s, i, length):
+        """Returns the kind of the previous character, the current character and
+        whether it's the last one."""
+        if i == length:
+            current = None
+        else:
+            current = s[i:i + 1] if self.program.binary else s[i]
+
+        if not self.program.anchors:
+            return 0, current, False
+
+        previous = _START if i == 0 else self.kind(s[i - 1:i] if self.program.binary else s[i - 1])
+
+        return previous, current, i == length - 1
+
+    def follow(self, pcs, previous, current, last):
+        """Returns the instructions reachable from pcs without consuming characters
+        that consume one, and whether MATCH is reachable."""
+        code = self.program.code
+        stack = list(pcs)
+        seen = set()
+        chars = []
+        matched = False
+
+        while stack:
+            pc = stack.pop()
+            if pc in seen:
+                continue
+
+            seen.add(pc)
+            op, a, b = code[pc]
+
+            if op == _CHAR:
+                chars.append(pc)
+            elif op == _MATCH:
+                matched = True
+            elif op == _SPLIT:
+                stack.append(b)
+                stack.append(a)
+            elif op == _JUMP:
+                stack.append(a)
+            elif op == _SAVE:
+                stack.append(pc + 1)
+            elif op == _ASSERT:
+                if _holds(a, b, previous, current, last):
+                    stack.append(pc + 1)
+            else:
+                # _UNLESS
+                stack.append(pc + 1 if current is not None and a(current) else b)
+
+        return chars, matched
+
+    def exists(self, s, pos=0, search=False):
+        """Whether there is a match, using the DFA."""
+        code = self.program.code
+        transitions = self.transitions[search]
+        if len(transitions) > self.max_transitions:
+            transitions.clear()
+
+        start = frozenset((0, ))
+        state = start
+        length = len(s)
+
+        for i in range(pos, length + 1):
+            previous, current, last = self.context(s, i, length)
+            key = (state, previous, current, last)
+
+            try:
+                matched, state = transitions[key]
+            except KeyError:
+                chars, matched = self.follow(state, previous, current, last)
+                if current is None:
+                    next = frozenset()
+                else:
+                    next = frozenset(pc + 1 for pc in chars if code[pc][1](current))
+
+                if search:
+                    next |= start
+
+                transitions[key] = (matched, next)
+                state = next
+
+            if matched:
+                return True
+
+            if not state:
+                return False
+
+        return False
+
+    def run(self, s, pos=0, search=False):
+        """Returns the Match, or None; this one keeps the captures."""
+        code = self.program.code
+        length = len(s)
+        empty = (-1, ) * (2 * (self.groups + 1))
+        # threads, in order of priority: (pc, captures)
+        threads = [ (0, empty) ]
+        found = None
+
+        for i in range(pos, length + 1):
+            previous, current, last = self.context(s, i, length)
+
+            if search and found is None and i > pos:
+                # a match starting here has less priority than the ones already started
+                threads.append((0, empty))
+
+            # follow the threads until they need a character, keeping their order
+            ready = []
+            seen = set()
+            for thread in threads:
+                stack = [ thread ]
+
+                while stack:
+                    pc, captures = stack.pop()
+                    if pc in seen:
+                        continue
+
+                    seen.add(pc)
+                    op, a, b = code[pc]
+
+                    if op == _CHAR or op == _MATCH:
+                        ready.append((pc, captures))
+                    elif op == _SPLIT:
+                        stack.append((b, captures))
+                        stack.append((a, captures))
+                    elif op == _JUMP:
+                        stack.append((a, captures))
+                    elif op == _SAVE:
+                        stack.append((pc + 1, captures[:a] + (i, ) + captures[a + 1:]))
+                    elif op == _ASSERT:
+                        if _holds(a, b, previous, current, last):
+                            stack.append((pc + 1, captures))
+                    else:
+                        # _UNLESS
+                        stack.append((pc + 1 if current is not None and a(current) else b, captures))
+
+            threads = []
+            for pc, captures in ready:
+                if code[pc][0] == _MATCH:
+                    # the ones after this have less priority
+                    found = captures
+                    break
+
+                if current is not None and code[pc][1](current):
+                    threads.append((pc + 1, captures))
+
+            if not threads and (found is not None or not search):
+                break
+
+        if found is None:
+            return None
+
+        spans = tuple((found[index], found[index + 1]) for index in range(0, len(found), 2))
+        values = tuple(s[start:end] if start != -1 else None for start, end in spans)
+
+        return Match(values, spans, self.groupindex)
+
+    def match(self, s, pos=0):
+        if not self.exists(s, pos):
+            return None
+
+        return self.run(s, pos)
+
+    def search(self, s, pos=0):
+        if not self.exists(s, pos, search=True):
+            return None
+
+        return self.run(s, pos, search=True)
+
+    def finditer(self, s, pos=0):
+        length = len(s)
+
+        while pos <= length:
+            match = self.run(s, pos, search=True)
+            if match is None:
+                break
+
+            yield match
+
+            start, end = match.span()
+            pos = end if end > start else end + 1
+
+
+def _re_engine(expression, flags=0, binary=False):
+    return re.compile(bytes(expression) if binary else str(expression), flags)
+
+
+# name -> function(expression, flags, binary) that returns a compiled pattern;
+# it gets a simplified Dinant without flags, and returns something with match(),
+# search() and finditer() methods that return re.Match or Match objects, and
+# groupindex. they raise ValueError if they can't handle the expression
+_engines = {
+    're': _re_engine,
+    'linear': _LinearPattern,
+    }
+
+def register_engine(name, compile):
+    """Makes an engine available as Dinant(..., engine=name); see _engines."""
+    _engines[name] = compile
+
+
+# compiled patterns cache
+# shared by all expressions, so equal expressions built in different places are
+# compiled only once. re has its own, but it's small and we can't tell how it's doing
+CacheInfo = namedtuple('CacheInfo', 'hits misses maxsize currsize')
+ScanMatch = namedtuple('ScanMatch', 'line offset match')
+
+class _PatternCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.patterns = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def compile(self, expression, flags=0, simplify=None, binary=False, engine='re', build=None):
+        """Returns expression compiled. If given, simplify() is called when it's
+        not in the cache and its result compiled instead; it must be equivalent,
+        and bytes if binary is True. For other engines, build() compiles it."""
+        key = (expression, flags, binary, engine)
+
+        with self.lock:
+            pattern = self.patterns.get(key, None)
+            if pattern is not None:
+                self.hits += 1
+                self.patterns.move_to_end(key)
+
+                return pattern
+
+            self.misses += 1
+
+        # compile outside the lock
+        if build is not None:
+            pattern = build()
+        else:
+            pattern = re.compile(simplify() if simplify is not None else expression, flags)
+
+        with self.lock:
+            self.patterns[key] = pattern
+            self.evict()
+
+        return pattern
+
+    def evict(self):
+        while len(self.patterns) > self.maxsize:
+            # least recently used
+            self.patterns.popitem(last=False)
+
+    def resize(self, maxsize):
+        with self.lock:
+            self.maxsize = maxsize
+            self.evict()
+
+    def info(self):
+        with self.lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self.patterns))
+
+    def clear(self):
+        with self.lock:
+            self.patterns.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+_cache = _PatternCache(1024)
+
+def cache_info():
+    """Returns the hits, misses, maximum and current size of the compiled patterns cache."""
+    return _cache.info()
+
+def cache_clear():
+    _cache.clear()
+
+def set_cache_size(maxsize):
+    _cache.resize(maxsize)
+
+
+# instrumentation
+PatternStats = namedtuple('PatternStats', 'calls matches misses hit_ratio total_time percentiles '
+                                          'compile_time')
+
+class _Stats:
+    """Counters for the expressions instrumented with a name. Only the times of
+    the last samples calls are kept, for the percentiles."""
+    def __init__(self, samples):
+        self.lock = threading.Lock()
+        self.times = deque(maxlen=samples)
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.matches = 0
+        self.total_time = 0.0
+        self.compile_time = 0.0
+        self.times.clear()
+
+    def run(self, function, s):
+        """Returns function(s), recording how long it took and whether it matched."""
+        start = time.perf_counter()
+        result = function(s)
+        elapsed = time.perf_counter() - start
+
+        with self.lock:
+            self.calls += 1
+            if result is not None:
+                self.matches += 1
+            self.total_time += elapsed
+            self.times.append(elapsed)
+
+        return result
+
+    def compiled(self, elapsed):
+        with self.lock:
+            self.compile_time += elapsed
+
+    def resize(self, samples):
+        with self.lock:
+            # the last ones are kept
+            self.times = deque(self.times, maxlen=samples)
+
+    def snapshot(self, percentiles, reset=False):
+        with self.lock:
+            times = sorted(self.times)
+            result = PatternStats(self.calls, self.matches, self.calls - self.matches,
+                                  self.matches / self.calls if self.calls > 0 else None,
+                                  self.total_time,
+                                  { percentile: times[min(len(times) - 1, _int(len(times) * percentile / 100))]
+                                    for percentile in percentiles } if len(times) > 0 else {},
+                                  self.compile_time)
+
+            if reset:
+                self.reset()
+
+        return result
+
+
+# name -> _Stats
+_stats = {}
+_stats_lock = threading.Lock()
+
+def stats(reset=False, percentiles=(50, 90, 99)):
+    """Returns a dict with a PatternStats for each name used with
+    Dinant.instrument(). If reset is True the counters start over, so calling it
+    periodically gives the numbers for each period."""
+    with _stats_lock:
+        items = list(_stats.items())
+
+    return { name: counters.snapshot(percentiles, reset) for name, counters in items }
+
+
+# results
+class Match:
+    """A stand in for re.Match that does not refer to the string or the pattern, so
+    it can be pickled, ie, sent between processes. It's immutable."""
+    __slots__ = ('values', 'spans', 'groupindex')
+
+    def __init__(self, values, spans, groupindex):
+        # values and spans of all the groups, the whole match first
+        object.__setattr__(self, 'values', values)
+        object.__setattr__(self, 'spans', spans)
+        object.__setattr__(self, 'groupindex', groupindex)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Match objects are immutable')
+
+    def __reduce__(self):
+        return (Match, (self.values, self.spans, dict(self.groupindex)))
+
+    def _index(self, group):
+        if isinstance(group, str):
+            try:
+                return self.groupindex[group]
+            except KeyError:
+                raise IndexError('no such group')
+        else:
+            return group
+
+    def group(self, *args):
+        if len(args) == 0:
+            return self.values[0]
+        elif len(args) == 1:
+            return self.values[self._index(args[0])]
+        else:
+            return tuple(self.values[self._index(group)] for group in args)
+
+    __getitem__ = group
+
+    def groups(self, default=None):
+        return tuple(default if value is None else value for value in self.values[1:])
+
+    def groupdict(self, default=None):
+        return { name: default if self.values[index] is None else self.values[index]
+                 for name, index in self.groupindex.items() }
+
+    def span(self, group=0):
+        return self.spans[self._index(group)]
+
+    def start(self, group=0):
+        return self.span(group)[0]
+
+    def end(self, group=0):
+        return self.span(group)[1]
+
+    def __repr__(self):
+        return '<dinant.Match object; span=%r, match=%r>' % (self.spans[0], self.values[0])
+
+
+def _match_state(match, offset=0):
+    """Returns the values and spans of a re.Match; spans are moved by offset."""
+    values = (match.group(0), ) + match.groups()
+    spans = tuple((start + offset, end + offset) if start != -1 else (-1, -1)
+                  for start, end in (match.span(index) for index in range(len(values))))
+
+    return values, spans
+
+
+# columns
+def _column(values, convert, optional=False, use_numpy=None):
+    """Converts the values of a capture, as returned by findall(), into a column.
+    Ints become an array('q') and floats an array('d'), or NumPy arrays if it's
+    installed and use_numpy is not False. Optional captures, the ones that can be
+    empty, have NaN there, so their ints become an array('d') too, no matter if
+    some are actually empty; the type only depends on the expression. Other types
+    become a list of converted values, with None for the empty ones, and untyped
+    captures a list of the values as they are."""
+    if convert is None:
+        return list(values)
+
+    code = _array_codes.get(getattr(convert, 'func', convert), None)
+    if code is None:
+        return [ convert(value) if value else None for value in values ]
+
+    if optional:
+        column = array('d', (convert(value) if value else _nan for value in values))
+    else:
+        column = array(code, map(convert, values))
+
+    if use_numpy is not False:
+        try:
+            import numpy
+        except ImportError:
+            if use_numpy:
+                raise
+        else:
+            return numpy.asarray(column)
+
+    return column
+
+
+def _count_lines(buffer, start, end, window=2**20):
+    """Counts the newlines in buffer[start:end]. It's done by windows, so sparse
+    matches in a big file don't copy all of it between them at once."""
+    count = 0
+
+    while start < end:
+        stop = min(start + window, end)
+        count += buffer[start:stop].count(b'\n')
+        start = stop
+
+    return count
+
+
+# these run in other processes, so they only get the regexp and flags
+def _match_shard(expression, flags, search, lines, literals=()):
+    pattern = _cache.compile(expression, flags, binary=isinstance(expression, bytes))
+    method = pattern.search if search else pattern.match
+    result = []
+
+    for line in lines:
+        # memoryviews don't support `in`
+        if isinstance(line, (str, bytes, bytearray)) and _missing(literals, line):
+            result.append(None)
+            continue
+
+        match = method(line)
+        result.append(_match_state(match) if match is not None else None)
+
+    return result
+
+
+def _scan_shard(expression, flags, path, start, end, literals=()):
+    pattern = _cache.compile(expression, flags, binary=True)
+
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        result = []
+        line = 0
+        last = start
+
+        if any(buffer.find(literal, start, end) == -1 for literal in literals):
+            # nothing in this shard can match
+            matches = ()
+        else:
+            matches = pattern.finditer(buffer, start, end)
+
+        for match in matches:
+            line += _count_lines(buffer, last, match.start())
+            last = match.start()
+            result.append((line, _match_state(match)))
+
+        # the caller needs it for numbering the lines of the next shards
+        lines = line + _count_lines(buffer, last, end)
+    finally:
+        buffer.close()
+
+    return result, lines
+
+
+def _parallel(executor, processes, calls):
+    """Runs calls (an iterable of (function, args...) tuples) in a process pool,
+    yielding their results in order. Only a few are pending at any moment, so
+    neither the calls nor their results pile up in memory."""
+    own = executor is None
+    if own:
+        # importing it takes longer than importing everything else here
+        from concurrent.futures import ProcessPoolExecutor
+
+        executor = ProcessPoolExecutor(processes)
+
+    try:
+        max_pending = 2 * (processes or os.cpu_count() or 1)
+        pending = deque()
+
+        for call in calls:
+            pending.append(executor.submit(*call))
+
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        if own:
+            executor.shutdown(cancel_futures=True)
+
+
+DebugResult = namedtuple('DebugResult', 'line index subexpression prefix')
+
+class _Debugger:
+    """Finds which of the top level subexpressions fails matching. If a prefix of
+    the expression matches, all the shorter prefixes match too, so it bisects."""
+    def __init__(self, regexp, binary):
+        flatten = _flatten_bytes if binary else _flatten
+        self.items = [ flatten(item) for item in _concat_items(regexp.node) ]
+        self.empty = b'' if binary else ''
+        self.flags = regexp.flags
+        self.binary = binary
+        # number of items -> compiled prefix, or the syntax error
+        self.compiled = {}
+
+    def prefix(self, length):
+        return self.empty.join(self.items[:length])
+
+    def compile(self, length):
+        if length not in self.compiled:
+            try:
+                # not in the cache, it would be filled with prefixes
+                self.compiled[length] = re.compile(self.prefix(length), self.flags)
+            except re.error as e:
+                self.compiled[length] = e
+
+        return self.compiled[length]
+
+    def first_failure(self, s):
+        """Returns the length of the shortest prefix that fails matching s, or None
+        if the whole expression matches."""
+        whole = self.compile(len(self.items))
+        if isinstance(whole, re.error):
+            raise whole
+
+        if whole.match(s):
+            return None
+
+        # the empty prefix always matches, the whole expression doesn't
+        matches, fails = 0, len(self.items)
+
+        while fails - matches > 1:
+            middle = (matches + fails) // 2
+
+            # prefixes can have syntax errors, for instance in the middle of a
+            # regexp() group; use the closest one that compiles
+            candidates = chain(range(middle, fails), range(middle - 1, matches, -1))
+            length = next((length for length in candidates
+                           if not isinstance(self.compile(length), re.error)), None)
+            if length is None:
+                break
+
+            if self.compile(length).match(s):
+                matches = length
+            else:
+                fails = length
+
+        return fails
+
+
+# streams
+StreamMatch = namedtuple('StreamMatch', 'line match')
+
+async def _stream_lines(source, chunk_size=65536, max_line_length=65536):
+    """Yields the lines (bytes, without the newline) read from source, an
+    asyncio.StreamReader or any async iterable of bytes, as they're complete.
+    Nothing is read until the next line is needed, so a slow consumer slows down
+    the reading; at most one chunk and one line are kept in memory. Lines longer
+    than max_line_length are cut there and the rest is dropped."""
+    if hasattr(source, 'read'):
+        async def chunks(reader):
+            while True:
+                chunk = await reader.read(chunk_size)
+                if chunk == b'':
+                    break
+
+                yield chunk
+
+        source = chunks(source)
+
+    # the incomplete line at the end of the last chunk
+    rest = b''
+    # dropping the end of a line that was too long
+    dropping = False
+
+    async for chunk in source:
+        lines = (rest + chunk).split(b'\n')
+        rest = lines.pop()
+
+        if dropping:
+            if len(lines) > 0:
+                del lines[0]
+                dropping = False
+            else:
+                rest = b''
+
+        for line in lines:
+            yield line[:max_line_length]
+
+        if len(rest) > max_line_length:
+            yield rest[:max_line_length]
+            rest = b''
+            dropping = True
+
+    if rest != b'':
+        yield rest
+
+
+_local_lock = threading.Lock()
 
 class Dinant:
     # TODO: *others, should help fixing either()
     def __init__(self, other, escape=True, capture=False, name=None, times=None,
-                 greedy=True):
+                 greedy=True, possessive=False, flags=0, type=None, engine=None):
+        # validate them early
+        _flags_group(flags)
+        if engine is not None and engine != 'auto' and engine not in _engines:
+            raise ValueError('unknown engine %r' % engine)
+        # the type of what this expression matches, see _type()
+        self.type = None
+
+        # Dinant(Dinant('a')) == Dinant('a') but
+        # id(Dinant('a')) != id(Dinant('a'))
+        # both share the same (immutable) tree, so we can reuse portions at will
+        if isinstance(other, Dinant):
+            node = other.node
+            flags |= other.flags
+            if engine is None:
+                engine = other.engine
+            if times is None:
+                self.type = other.type
+        else:
+            node = _node(other, escape)
+
+        if times is not None:
+            fail = False
+
+            if isinstance(times, _int):
+                node = _Repeat(node, times, times, possessive=possessive)
+            elif isinstance(times, list):
+                if len(times) == 1:
+                    # times is the lower bound
+                    if times[0] == 0:
+                        node = zero_or_more(node, greedy, possessive).node
+                    elif times[0] == 1:
+                        node = one_or_more(node, greedy, possessive).node
+                    else:
+                        fail = True
+
+                elif len(times) == 2:
+                    if times[1] == 1 and (times[0] is None or times[0] is Ellipsis):
+                        node = maybe(node, greedy, possessive).node
+                    else:
+                        node = between(*times, node, greedy, possessive).node
+                else:
+                    fail = True
+
+            if fail:
+                raise ValueError('times must be either an integer, [0, ], [1, ] or [m, n], where m or n could be ... ')
+
+        if type is not None:
+            type = _type(type, self)
+
+        if capture is False and name is None:
+            if type is not None:
+                node = _Group('(', node, type=type)
+        elif capture is True and name is None:
+            node = _Group('(', node, type=type)
+        elif isinstance(capture, str) or name is not None:
+            name = name if name is not None else capture
+
+            # capture holds the name to use
+            node = _Group('(?P<', node, name, type)
+
+        self.node = node
+        self.flags = flags
+        self.engine = engine if engine is not None else 're'
+
+        # caches
+        self.expression = None
+        self.compiled = None
+        self.compiled_bytes = None
+        self.converters = None
+        # see extract_all()
+        self.optional = None
+        # see _literals() and _matcher()
+        self.literals = None
+        self.literals_bytes = None
+        self.matchers = {}
+        # (flags, binary) -> engine, for engine='auto'
+        self.engines = {}
+        # for matches(), see there
+        self.local = None
+        # see instrument()
+        self.stats = None
+        # (engine, flags, binary) whose compilation was already added to stats
+        self.timed = set()
+
+
+    def __add__(self, other):
+        if isinstance(other, (str, Dinant, CharClass)):
+            other = _node(other)
+        else:
+            return NotImplemented
+
+        return Dinant(_Concat((_node(self), other)))
+
+
+    def __radd__(self, other):
+        if isinstance(other, str):
+            return Dinant(_Concat((_Text(other), _node(self))))
+        else:
+            raise ValueError('str expected, got %r' % (other, ))
+
+
+    def __str__(self):
+        if self.expression is None:
+            # compact
+            self.expression = _flatten(self.node)
+
+        return self.expression
+
+
+    def __bytes__(self):
+        return _flatten_bytes(self.node)
+
+
+    def __repr__(self):
+        if self.flags != 0:
+            return 'Dinant(%r, flags=%r)' % (self.node, re.RegexFlag(self.flags))
+        else:
+            return 'Dinant(%r)' % (self.node, )
+
+
+    def analyze(self):
+        """Looks for subexpressions that can make matching take exponential or
+        polynomial time, like nested quantifiers ((?:a+)+), consecutive ones that can
+        match the same characters (\\d+\\d+) or alternatives that can start with the
+        same characters. Returns an Analysis with the estimated worst case and a list
+        of Issues. It's a heuristic: it can find issues where there are none."""
+        return _analyze(_simplify(self.node))
+
+
+    def safe(self):
+        """Returns an equivalent expression with the issues analyze() finds rewritten,
+        where it's possible."""
+        return Dinant(_simplify(_safe(_simplify(self.node))), flags=self.flags)
+
+
+    def instrument(self, name, samples=None):
+        """Returns a copy of the expression whose calls to match(), matches(),
+        search() and parse() are counted and timed, together with its compilation,
+        under name; see stats(). Expressions instrumented with the same name are
+        counted together. The percentiles are computed over the last samples calls
+        (1000 by default); giving it for an existing name changes it for all of
+        them."""
+        result = Dinant(self)
+
+        with _stats_lock:
+            counters = _stats.get(name, None)
+            if counters is None:
+                counters = _stats[name] = _Stats(samples if samples is not None else 1000)
+            elif samples is not None:
+                counters.resize(samples)
+
+        result.stats = counters
+
+        return result
+
+
+    def simplify(self):
+        """Returns an equivalent expression without redundant groups, with adjacent
+        literals merged, alternations of single characters converted to a class and
+        the common literal prefixes of alternatives factored out."""
+        return Dinant(_simplify(self.node), flags=self.flags)
+
+
+    def _compile(self, flags=0, binary=False):
+        engine = self.engine
+        if engine == 'auto':
+            engine = self.engines.get((flags, binary), None)
+            if engine is None:
+                try:
+                    self._compile_with('linear', flags, binary)
+                    engine = 'linear'
+                except ValueError:
+                    engine = 're'
+
+                self.engines[(flags, binary)] = engine
+
+        return self._compile_with(engine, flags, binary)
+
+
+    def _compile_with(self, engine, flags=0, binary=False):
+        key = (engine, flags, binary)
+        if self.stats is None or key in self.timed:
+            return self._compile_cached(engine, flags, binary)
+
+        # the first one is timed even if it's a cache hit, so an equal expression
+        # compiled before doesn't leave compile_time at 0
+        start = time.perf_counter()
+        result = self._compile_cached(engine, flags, binary)
+        self.stats.compiled(time.perf_counter() - start)
+        self.timed.add(key)
+
+        return result
+
+
+    def _compile_cached(self, engine, flags=0, binary=False):
+        # trees with the same str can have different bytes translations, like
+        # regexp('é{2}') and Dinant('é', times=2), so those are cached by node
+        key = self.node if binary else str(self)
+
+        if engine == 're':
+            if binary:
+                simplify = lambda: _flatten_bytes(_simplify(self.node))
+            else:
+                simplify = lambda: str(self.simplify())
+
+            return _cache.compile(key, self.flags | flags, simplify, binary)
+        else:
+            build = lambda: _engines[engine](Dinant(_simplify(self.node)), self.flags | flags, binary)
+
+            return _cache.compile(key, self.flags | flags, binary=binary, engine=engine,
+                                  build=build)
+
+
+    def engine_used(self, flags=0, binary=False):
+        """Returns the name of the engine used for matching strs (or bytes, if binary
+        is True) with flags; with engine='auto', it's 'linear' if it supports the
+        expression, 're' otherwise."""
+        if self.engine == 'auto':
+            self._compile(flags, binary)
+            return self.engines[(flags, binary)]
+        else:
+            return self.engine
+
+
+    def _pattern(self, s, flags=0):
+        """Returns the compiled pattern for matching s, as str or bytes."""
+        binary = isinstance(s, (bytes, bytearray, memoryview))
+
+        if flags != 0:
+            # the cache can handle these
+            return self._compile(flags, binary)
+        elif binary:
+            if self.compiled_bytes is None:
+                self.compiled_bytes = self._compile(binary=True)
+
+            return self.compiled_bytes
+        else:
+            if self.compiled is None:
+                self.compiled = self._compile()
+
+            return self.compiled
+
+
+    def _literals(self, s, flags=0):
+        """Returns the texts that s must contain for matching, of the same type."""
+        if (self.flags | flags) & IGNORECASE:
+            return ()
+
+        if self.literals is None:
+            self.literals = _required_literals(_simplify(self.node))
+
+        if isinstance(s, str):
+            return self.literals
+        elif isinstance(s, (bytes, bytearray)):
+            if self.literals_bytes is None:
+                self.literals_bytes = tuple(literal.encode('utf-8') for literal in self.literals)
+
+            return self.literals_bytes
+        else:
+            # memoryviews and such don't support `in`
+            return ()
+
+
+    def _matcher(self, s, flags=0, search=False):
+        """Returns a function that matches (or searches, if search is True) strings
+        like s and returns the re.Match or None. Strings that lack some of the
+        literals are not even tried; see _required_literals(). They're built once
+        per type of string and flags, so this is the fast path."""
+        key = (type(s), flags, search)
+
+        try:
+            return self.matchers[key]
+        except KeyError:
+            pass
+
+        pattern = self._pattern(s, flags)
+        result = _prefiltered(pattern.search if search else pattern.match, self._literals(s, flags))
+        if self.stats is not None:
+            result = partial(self.stats.run, result)
+
+        self.matchers[key] = result
+
+        return result
+
+
+    def _converted(self, match):
+        """Returns match with its typed captures converted, as a Match; or as is if
+        there are none."""
+        if self.converters is None:
+            self.converters = _converters(self.node)
+
+        if match is None or len(self.converters) == 0:
+            return match
+
+        if isinstance(match, Match):
+            values, spans = match.values, match.spans
+            groupindex = match.groupindex
+        else:
+            values, spans = _match_state(match)
+            groupindex = match.re.groupindex
+
+        values = list(values)
+        for index, convert in self.converters:
+            if values[index] is not None:
+                values[index] = convert(values[index])
+
+        return Match(tuple(values), spans, groupindex)
+
+
+    def matches(self, s, flags=0):
+        # the last match is kept per thread, so expressions can be shared between them
+        local = self.local
+        if local is None:
+            with _local_lock:
+                if self.local is None:
+                    self.local = threading.local()
+
+                local = self.local
+
+        local.g = self._converted(self._matcher(s, flags)(s))
+
+        return local.g is not None
+
+
+    def parse(self, s, search=False, flags=0):
+        """Matches s (or searches it if search is True) and returns a Match, with the
+        typed captures converted, or None. Unlike matches(), nothing is stored in the
+        expression."""
+        match = self._matcher(s, flags, search)(s)
+        if match is None:
+            return None
+
+        match = self._converted(match)
+        if not isinstance(match, Match):
+            match = Match(*_match_state(match), match.re.groupindex)
+
+        return match
+
+
+    def __getitem__(self, index):
+        return str(self)[index]
+
+
+    def match(self, s, flags=0):
+        """For compatibility with the `re` module. If there are typed captures,
+        returns a Match with them converted."""
+        return self._converted(self._matcher(s, flags)(s))
+
+
+    def debug(self, s):
+        """Finds the first subexpression that fails matching. Returns the expression
+        up to and including it, True if it matches, or raises the syntax error."""
+        binary = isinstance(s, (bytes, bytearray, memoryview))
+        debugger = _Debugger(self, binary)
+
+        failed = debugger.first_failure(s)
+        if failed is None:
+            # it matched
+            return True
+        else:
+            return debugger.prefix(failed)
+
+
+    def debug_lines(self, lines):
+        """Like debug(), but for many lines. Returns a list with a DebugResult for
+        each line, or None if it matches. Prefixes are compiled only once."""
+        # one for str, one for bytes
+        debuggers = {}
+        result = []
+
+        for line in lines:
+            binary = isinstance(line, (bytes, bytearray, memoryview))
+            if binary not in debuggers:
+                debuggers[binary] = _Debugger(self, binary)
+
+            debugger = debuggers[binary]
+            failed = debugger.first_failure(line)
+
+            if failed is None:
+                result.append(None)
+            else:
+                result.append(DebugResult(line, failed - 1, debugger.items[failed - 1],
+                                          debugger.prefix(failed)))
+
+        return result
+
+
+    def _key(self):
+        """What makes two expressions equal: the same regexp, flags and engine, and
+        the same types for the same captures."""
+        if self.converters is None:
+            self.converters = _converters(self.node)
+
+        return (str(self), self.flags, self.engine, self.converters)
+
+
+    def __eq__(self, other):
+        if not isinstance(other, Dinant):
+            return NotImplemented
+
+        return self._key() == other._key()
+
+
+    def __hash__(self):
+        # consistent with __eq__()
+        return hash(self._key())
+
+
+    def search(self, s, flags=0):
+        return self._converted(self._matcher(s, flags, search=True)(s))
+
+
+    def finditer(self, s, flags=0):
+        """Yields the matches of the expression in s, like re.finditer(), with the
+        typed captures converted."""
+        if _missing(self._literals(s, flags), s):
+            return
+
+        for match in self._pattern(s, flags).finditer(s):
+            yield self._converted(match)
+
+
+    def extract_all(self, source, flags=0, use_numpy=None):
+        """Finds all the matches in source and returns a dict with a column for each
+        named capture, in order, without building a match object for any of them.
+        Source is a str, bytes or mmap, or an iterable of lines without their
+        newlines, which are joined; it's searched in MULTILINE mode, like in scan().
+        Integer captures come back as array('q'), floats and optional integers as
+        array('d'), or all of them as NumPy arrays if it's installed; see _column()."""
+        if not isinstance(source, (str, bytes, bytearray, mmap.mmap)):
+            lines = iter(source)
+            first = next(lines, '')
+            newline = '\n' if isinstance(first, str) else b'\n'
+            source = newline.join(chain((first, ), lines))
+
+        binary = not isinstance(source, str)
+        pattern = self._compile(MULTILINE | flags, binary)
+        names = sorted(pattern.groupindex.items(), key=lambda item: item[1])
+        if len(names) == 0:
+            return {}
+
+        if self.converters is None:
+            self.converters = _converters(self.node)
+        if self.optional is None:
+            self.optional = _optional_groups(self.node)
+
+        if any(source.find(literal) == -1 for literal in self._literals(b'' if binary else '', flags)):
+            columns = []
+        elif hasattr(pattern, 'findall'):
+            found = pattern.findall(source)
+            # findall() returns the only group as is instead of in tuples
+            columns = [ found ] if pattern.groups == 1 else list(zip(*found))
+        else:
+            # other engines
+            columns = list(zip(*(match.groups('') for match in pattern.finditer(source))))
+
+        if len(columns) == 0:
+            columns = [ () ] * names[-1][1]
+        converters = dict(self.converters)
+
+        return { name: _column(columns[index - 1], converters.get(index, None), index in self.optional,
+                               use_numpy)
+                 for name, index in names }
+
+
+    def scan(self, path, flags=0):
+        """Searches the whole file at path for the expression, yielding a ScanMatch
+        with the line number (starting at 1), the offset in bytes and the (bytes)
+        match object. The file is mmap'ed and searched in MULTILINE mode, so bol and
+        eol match at the beginning and end of each line, but the expression should
+        not match newlines itself, or matches can span several lines."""
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # can't mmap empty files
+                return
+
+            # the mmap is not closed explicitly because the match objects refer to it;
+            # it's closed when none of them are left
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if any(buffer.find(literal) == -1 for literal in self._literals(b'', flags)):
+            # nothing in the file can match
+            return
+
+        pattern = self._compile(MULTILINE | flags, binary=True)
+        line = 1
+        last = 0
+
+        for match in pattern.finditer(buffer):
+            start = match.start()
+            # count lines only between matches
+            line += _count_lines(buffer, last, start)
+            last = start
+
+            yield ScanMatch(line, start, self._converted(match))
+
+
+    async def stream(self, source, search=False, flags=0, chunk_size=65536,
+                     max_line_length=65536):
+        """Reads lines from source, an asyncio.StreamReader or any async iterable of
+        bytes, and matches (or searches, if search is True) each of them as soon as
+        it's complete. It's an async generator that yields a StreamMatch with the
+        line number (starting at 1) and the (bytes) match object for each line that
+        matches. Source is read only as matches are consumed, so a slow consumer
+        makes the source wait instead of piling up lines. See _stream_lines()."""
+        pattern = self._compile(flags, binary=True)
+        method = pattern.search if search else pattern.match
+        literals = self._literals(b'', flags)
+        number = 0
+
+        async for line in _stream_lines(source, chunk_size, max_line_length):
+            number += 1
+
+            if _missing(literals, line):
+                continue
+
+            match = method(line)
+            if match is not None:
+                yield StreamMatch(number, self._converted(match))
+
+
+    def parallel_match(self, lines, search=False, flags=0, processes=None, executor=None,
+                       shard_size=10000):
+        """Like calling match() (or search() if search is True) on each of lines,
+        but the work is split in shards of shard_size lines and done by a pool of
+        processes (or the executor given). Yields the results in order, Match
+        objects or None. Lines can be any iterable, and it's consumed only as
+        results are needed."""
+        flags |= self.flags
+        # the regexps, str and bytes, are what is sent to the other processes
+        expressions = {}
+
+        def calls():
+            shard = []
+            for line in lines:
+                # memoryviews can't be pickled to send them to the other processes
+                shard.append(bytes(line) if isinstance(line, memoryview) else line)
+
+                if len(shard) == shard_size:
+                    yield call(shard)
+                    shard = []
+
+            if len(shard) > 0:
+                yield call(shard)
+
+        def call(shard):
+            binary = isinstance(shard[0], (bytes, bytearray))
+            if binary not in expressions:
+                simplified = _simplify(self.node)
+                expressions[binary] = _flatten_bytes(simplified) if binary else _flatten(simplified)
+
+            return (_match_shard, expressions[binary], flags, search, shard,
+                    self._literals(b'' if binary else '', flags))
+
+        groupindex = self._pattern('', flags).groupindex
+
+        for results in _parallel(executor, processes, calls()):
+            for result in results:
+                yield self._converted(Match(*result, groupindex)) if result is not None else None
+
+
+    def parallel_scan(self, path, flags=0, processes=None, executor=None, shard_size=2**24):
+        """Like scan(), but the file is split in shards of around shard_size bytes,
+        at line boundaries, which are searched by a pool of processes (or the
+        executor given). Yields ScanMatches in order, with Match objects."""
+        flags |= MULTILINE | self.flags
+        expression = _flatten_bytes(_simplify(self.node))
+        literals = self._literals(b'', flags)
+
+        def calls():
+            with open(path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size == 0:
+                    return
+
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            try:
+                start = 0
+                while start < size:
+                    # end the shard after the next newline
+                    end = buffer.find(b'\n', min(start + shard_size, size) - 1)
+                    end = size if end == -1 else end + 1
+
+                    yield (_scan_shard, expression, flags, path, start, end, literals)
+                    start = end
+            finally:
+                buffer.close()
+
+        groupindex = self._compile(flags, binary=True).groupindex
+        lines = 1
+
+        for results, shard_lines in _parallel(executor, processes, calls()):
+            for line, state in results:
+                match = self._converted(Match(*state, groupindex))
+                yield ScanMatch(lines + line, match.start(), match)
+
+            lines += shard_lines
+
+
+    @property
+    def g(self):
+        """The result of the last call to matches() in this thread."""
+        if self.local is None or not hasattr(self.local, 'g'):
+            raise ValueError('''This regular expression hasn't matched anything yet.''')
+
+        return self.local.g
+
+
+    def groups(self):
+        return self.g.groups()
+
+
+    def group(self, *args):
+        return self.g.group(*args)
 
-        if times is not None:
-            fail = False
 
-            if isinstance(times, _int):
-                other = exactly(times, other)
-            elif isinstance(times, list):
-                if len(times) == 1:
-                    # times is the lower bound
-                    if times[0] == 0:
-                        other = zero_or_more(other, greedy)
-                    elif times[0] == 1:
-                        other = one_or_more(other, greedy)
-                    else:
-                        fail = True
+    def __call__(self, *args, **kwargs):
+        # for supporting d.integer and d.integer(capture='foo')
+        return Dinant(self, *args, **kwargs)
 
-                elif len(times) == 2:
-                    if times[1] == 1 and (times[0] is None or times[0] is Ellipsis):
-                        other = maybe(other, greedy)
-                    else:
-                        other = between(*times, other, greedy)
-                else:
-                    fail = True
 
-            if fail:
-                raise ValueError('times must be either an integer, [0, ], [1, ] or [m, n], where m or n could be ... ')
+def _rename(node, rename, done=None):
+    """Returns a copy of the tree with its group names (and backreferences to
+    them) changed to rename(name)."""
+    if done is None:
+        done = {}
+
+    key = id(node)
+    if key in done:
+        return done[key]
+
+    if isinstance(node, _Concat):
+        result = _Concat([ _rename(item, rename, done) for item in _concat_items(node) ])
+    elif isinstance(node, _Group):
+        name = rename(node.name) if node.name is not None else None
+        result = _Group(node.kind, _rename(node.child, rename, done), name, node.type)
+    elif isinstance(node, _Repeat):
+        result = _Repeat(_rename(node.child, rename, done), node.min, node.max, node.greedy,
+                         node.possessive)
+    elif isinstance(node, _Either):
+        result = _Either([ _rename(branch, rename, done) for branch in node.branches ])
+    elif isinstance(node, _Backref):
+        result = _Backref(rename(node.name))
+    else:
+        result = node
 
-        if isinstance(other, str):
-            if escape:
-                self.strings = [ re.escape(other) ]
-            else:
-                self.strings = [ other ]
-        else:
-            # Dinant(Dinant('a')) == Dinant('a') but
-            # id(Dinant('a')) != id(Dinant('a'))
-            # the leftmost protion accumulates all the other ones in its .string attr
-            # so we copy so we can reuse portions at will
-            # see __add__()
-            self.strings = copy.copy(other.strings)
+    done[key] = result
 
-        if capture is False:
-            pass
-        elif capture is True:
-            # fastest way as per timeit, py3.5
-            l = [ '(' ]
-            l.extend(self.strings)
-            l.append(')')
-            self.strings = l
-        elif isinstance(capture, str) or name is not None:
-            name = name if name is not None else capture
+    return result
 
-            # capture holds the name to use
-            l = [ '(?P<', name, '>' ]
-            l.extend(self.strings)
-            l.append(')')
-            self.strings = l
 
-        # caches
-        self.expression = None
-        self.compiled = None
+# named groups, references to groups by name or number and conditionals, which
+# can't be renamed or renumbered inside raw regexps
+_raw_references = re.compile(r'\(\?P[<=]|\(\?\(|(?<!\\)(?:\\\\)*\\[1-9]')
 
+RuleMatch = namedtuple('RuleMatch', 'rule groups match')
 
-    def __add__(self, other):
-        result = Dinant(self)
+class RuleSet:
+    """Matches several named expressions at once, with a single regexp. Takes the
+    same arguments as dict(); the names are the keys. Rules are tried in order."""
+    def __init__(self, *args, **kwargs):
+        self.rules = dict(*args, **kwargs)
 
-        if isinstance(other, str):
-            result.strings.append(re.escape(other))
-        else:
-            result.strings.extend(other.strings)
+        branches = []
+        # tag -> (rule, [ (name, tagged_name), ... ])
+        self.tags = {}
 
-        return result
+        for index, (rule, regexp) in enumerate(self.rules.items()):
+            # each rule is captured in a group named after its position, and its
+            # groups are prefixed with it, so they don't collide with other rules'
+            tag = '_%d' % index
+            names = []
 
+            def rename(name, tag=tag, names=names):
+                tagged = '%s_%s' % (tag, name)
+                if (name, tagged) not in names:
+                    names.append((name, tagged))
 
-    def __radd__(self, other):
-        result = Dinant(self)
+                return tagged
 
-        if isinstance(other, str):
-            # faster than result.strings.insert(0, re.escape(other))
-            # and [ re.escape(other) ]+self.strings creates another list besides [ re.escape(other) ]
-            result.strings = [ re.escape(other) ]
-            result.strings.extend(self.strings)
-        else:
-            raise ValueError('str expected, got %r')
+            node = _node(regexp)
+            for item in _walk(node):
+                if isinstance(item, _Regexp) and _raw_references.search(item.string) is not None:
+                    raise ValueError("rule %r: named groups and backreferences inside regexp()s can't "
+                                     "be renamed, use capture() and backref() instead" % (rule, ))
 
-        return result
+            node = _rename(node, rename)
+            branches.append(_Group('(?P<', node, tag))
+            self.tags[tag] = (rule, names)
 
+        self.regexp = Dinant(_Either(branches))
 
-    def __str__(self):
-        if self.expression is None:
-            # compact
-            self.expression = ''.join(self.strings)
 
-        return self.expression
+    def _result(self, match):
+        if match is None:
+            return None
+
+        # the rule's group is the outermost, so it's the last one to close
+        rule, names = self.tags[match.lastgroup]
+        match = self.regexp._converted(match)
+        groups = { name: match.group(tagged) for name, tagged in names }
+
+        return RuleMatch(rule, groups, match)
+
+
+    def match(self, s, flags=0):
+        """Returns a RuleMatch with the name of the first rule that matches s, its
+        named groups and the match object; or None if none matches."""
+        return self._result(self.regexp._pattern(s, flags).match(s))
+
+
+    def search(self, s, flags=0):
+        return self._result(self.regexp._pattern(s, flags).search(s))
+
+
+    async def stream(self, source, search=False, flags=0, chunk_size=65536,
+                     max_line_length=65536):
+        """Like Dinant.stream(), but yields StreamMatches with RuleMatches."""
+        pattern = self.regexp._compile(flags, binary=True)
+        method = pattern.search if search else pattern.match
+        number = 0
+
+        async for line in _stream_lines(source, chunk_size, max_line_length):
+            number += 1
+
+            match = method(line)
+            if match is not None:
+                yield StreamMatch(number, self._result(match))
 
 
     def __repr__(self):
-        return 'Dinant%r' % self.strings
+        return 'RuleSet(%r)' % (self.rules, )
 
 
-    def matches(self, s):
-        if self.compiled is None:
-            self.compiled = re.compile(str(self))
+# backtracking analysis
+# characters are approximated by ASCII plus one non ASCII letter; enough to
+# tell whether two subexpressions can match the same characters
+__universe = [ chr(code) for code in range(128) ] + [ 'é' ]
+__everything = frozenset(__universe)
+__charsets = {}
 
-        self.g = self.compiled.match(s)
+def _charset(regexp):
+    """Returns which characters the one character regexp matches."""
+    if regexp not in __charsets:
+        pattern = re.compile(regexp)
+        __charsets[regexp] = frozenset(char for char in __universe if pattern.fullmatch(char))
 
-        return self.g is not None
+    return __charsets[regexp]
 
 
-    def __getitem__(self, index):
-        if self.expression is None:
-            self.expression = ''.join(self.strings)
+# what the analysis knows about a subexpression: whether it can match the empty
+# string; the characters its matches can start and end with, and contain; and
+# the minimum and maximum (None for no limit) length of its matches
+_Info = namedtuple('_Info', 'nullable first last chars min max')
 
-        return self.expression[index]
+def _text_info(text):
+    if text == '':
+        return _Info(True, frozenset(), frozenset(), frozenset(), 0, 0)
 
+    return _Info(False, frozenset(text[0]), frozenset(text[-1]), frozenset(text), len(text), len(text))
 
-    def match(self, s):
-        """For compatibility with the `re` module."""
-        if self.compiled is None:
-            self.compiled = re.compile(str(self))
+def _char_info(chars):
+    return _Info(False, chars, chars, chars, 1, 1)
 
-        return self.compiled.match(s)
+__zero_width = _Info(True, frozenset(), frozenset(), frozenset(), 0, 0)
+__unknown = _Info(True, __everything, __everything, __everything, 0, None)
 
+def _ignore_case(info):
+    swap = lambda chars: chars | frozenset(char.swapcase() for char in chars)
+    return info._replace(first=swap(info.first), last=swap(info.last), chars=swap(info.chars))
 
-    def debug(self, s):
-        """Match incrementally until one of the subexpression fails matching. Returns the non-matching expression,
-        True if it matches, or raise teh point where there is a syntax error."""
-        so_far = ''
-        syntax_error = None
 
-        for string in self.strings:
-            so_far += string
-            try:
-                compiled = re.compile(so_far)
-            except re.error as e:
-                syntax_error = e
+def _info(node, done):
+    key = id(node)
+    if key in done:
+        return done[key]
+
+    if isinstance(node, _Text):
+        result = _text_info(node.text)
+    elif isinstance(node, _Class):
+        result = _char_info(_charset(_flatten(node)))
+    elif isinstance(node, _Regexp):
+        if node.string in ('^', '$', '\\A', '\\Z', '\\b', '\\B'):
+            result = __zero_width
+        elif node.atomic:
+            result = _char_info(_charset(node.string))
+        elif _is_literal(node.string):
+            # no special characters, just text
+            result = _text_info(node.string)
+        else:
+            result = __unknown
+    elif isinstance(node, _Concat):
+        infos = [ _info(item, done) for item in _concat_items(node) ]
+        result = _concat_info(infos)
+    elif isinstance(node, _Group):
+        if node.kind in ('(?=', '(?!', '(?<=', '(?<!'):
+            result = __zero_width
+        else:
+            result = _info(node.child, done)
+            if node.kind.startswith('(?') and node.kind.endswith(':') and 'i' in node.kind:
+                result = _ignore_case(result)
+    elif isinstance(node, _Repeat):
+        child = _info(node.child, done)
+        if node.max == 0:
+            result = __zero_width
+        else:
+            result = _Info(node.min == 0 or child.nullable, child.first, child.last, child.chars,
+                           node.min * child.min,
+                           None if node.max is None or child.max is None else node.max * child.max)
+    elif isinstance(node, _Either):
+        infos = [ _info(branch, done) for branch in node.branches ]
+        union = lambda field: frozenset().union(*(getattr(info, field) for info in infos))
+        maxes = [ info.max for info in infos ]
+        result = _Info(any(info.nullable for info in infos), union('first'), union('last'), union('chars'),
+                       min(info.min for info in infos), None if None in maxes else max(maxes))
+    else:
+        # backrefs
+        result = __unknown
+
+    done[key] = result
+
+    return result
+
+
+def _concat_info(infos):
+    first = frozenset()
+    for info in infos:
+        first |= info.first
+        if not info.nullable:
+            break
+
+    last = frozenset()
+    for info in reversed(infos):
+        last |= info.last
+        if not info.nullable:
+            break
+
+    maxes = [ info.max for info in infos ]
+
+    return _Info(all(info.nullable for info in infos), first, last,
+                 frozenset().union(*(info.chars for info in infos)),
+                 sum(info.min for info in infos), None if None in maxes else sum(maxes))
+
+
+Issue = namedtuple('Issue', 'kind subexpression worst_case message')
+Analysis = namedtuple('Analysis', 'worst_case issues')
+
+def _worse(a, b):
+    """Compares worst cases, given as the degree of the polynomial (1 for linear),
+    or None for exponential."""
+    if a is None or b is None:
+        return None
+    else:
+        return max(a, b)
+
+def _worst_case_name(degree):
+    if degree is None:
+        return 'exponential'
+    elif degree == 1:
+        return 'linear'
+    else:
+        return 'O(n^%d)' % degree
+
+
+def _analyze(node):
+    """Looks for subexpressions that can make the backtracking engine try an
+    exponential or polynomial number of ways of matching a string."""
+    done = {}
+    issues = []
+    # (node, inside an unbounded repeat)
+    stack = [ (node, False) ]
+
+    while stack:
+        item, repeated = stack.pop()
+
+        if isinstance(item, _Concat):
+            items = _concat_items(item)
+            _adjacent_quantifiers(items, done, issues)
+            stack.extend((child, repeated) for child in items)
+
+        elif isinstance(item, _Repeat):
+            child = _info(item.child, done)
+            unbounded = item.max is None
+
+            # possessive ones don't backtrack, so they're fine
+            if ( unbounded and not item.possessive and child.min != child.max and
+                 child.last & child.first ):
+                # (a+)+: the end of one iteration can be the beginning of the next,
+                # so a string can be split in iterations in many ways
+                issues.append(Issue('nested quantifiers', _flatten(item), 'exponential',
+                                    'the repeated subexpression has a variable length and can '
+                                    'end with the same characters it starts with'))
+
+            stack.append((item.child, repeated or unbounded))
+
+        elif isinstance(item, _Either):
+            infos = [ _info(branch, done) for branch in item.branches ]
+
+            for i, (branch, info) in enumerate(zip(item.branches, infos)):
+                for other, other_info in zip(item.branches[i + 1:], infos[i + 1:]):
+                    if info.first & other_info.first:
+                        # (a|ab): both are tried; under a repeat, in every iteration
+                        issues.append(Issue('ambiguous alternation', _flatten(item),
+                                            'exponential' if repeated else 'linear',
+                                            'alternatives %r and %r can start with the same characters'
+                                            % (_flatten(branch), _flatten(other))))
+                        break
+                else:
+                    continue
+
+                break
+
+            stack.extend((branch, repeated) for branch in item.branches)
+
+        elif isinstance(item, _Group):
+            stack.append((item.child, repeated))
+
+    degree = 1
+    for issue in issues:
+        if issue.worst_case == 'exponential':
+            degree = None
+        elif issue.worst_case.startswith('O('):
+            degree = _worse(degree, _int(issue.worst_case[4:-1]))
+
+    return Analysis(_worst_case_name(degree), issues)
+
+
+def _adjacent_quantifiers(items, done, issues):
+    """\\d+\\d+: the first one can give any number of characters to the second."""
+    infos = [ _info(item, done) for item in items ]
+    i = 0
+
+    while i < len(items):
+        # possessive ones don't give back anything to the next ones
+        if not (isinstance(items[i], _Repeat) and items[i].max is None and not items[i].possessive):
+            i += 1
+            continue
+
+        # extend the chain as long as the next unbounded one overlaps with the
+        # previous and only nullable things are in between
+        chain = [ i ]
+        j = i + 1
+        while j < len(items) and not items[chain[-1]].possessive:
+            if isinstance(items[j], _Repeat) and items[j].max is None:
+                if infos[j].chars & infos[chain[-1]].chars:
+                    chain.append(j)
+                    j += 1
+                    continue
+                else:
+                    break
+            elif infos[j].nullable:
+                j += 1
             else:
-                syntax_error = None
-                if not compiled.match(s):
-                    return so_far
+                break
 
-        if syntax_error is not None:
-            raise syntax_error
+        if len(chain) > 1:
+            subexpression = ''.join(_flatten(item) for item in items[chain[0]:chain[-1] + 1])
+            issues.append(Issue('adjacent quantifiers', subexpression, 'O(n^%d)' % len(chain),
+                                '%d consecutive repetitions can match the same characters' % len(chain)))
+            i = chain[-1]
         else:
-            # it matched
-            return True
+            i += 1
 
 
-    def __eq__(self, other):
-        return self.strings == other.strings
+def _has_captures(node):
+    return any(isinstance(item, _Group) and item.kind in ('(', '(?P<') or
+               isinstance(item, _Regexp) and _regexp_groups(item.string) > 0
+               for item in _walk(node))
 
 
-    def search(self, s):
-        if self.compiled is None:
-            self.compiled = re.compile(str(self))
+def _walk(node):
+    """Yields all the nodes in the tree."""
+    stack = [ node ]
 
-        return self.compiled.search(s)
+    while stack:
+        item = stack.pop()
+        if isinstance(item, _Node):
+            yield item
+            stack.extend(item.parts())
 
 
-    def groups(self):
-        if not hasattr(self, 'g'):
-            raise ValueError('''This regular expression hasn't matched anything yet.''')
+def _safe(node, done=None):
+    """Rewrites the subexpressions found by _analyze() into equivalent ones when
+    possible. The node must be already simplified."""
+    if done is None:
+        done = {}
 
-        return self.g.groups()
+    key = id(node)
+    if key in done:
+        return done[key]
 
+    if isinstance(node, _Concat):
+        items = []
+        for item in _concat_items(node):
+            item = _safe(item, done)
 
-    def group(self, *args):
-        if not hasattr(self, 'g'):
-            raise ValueError('''This regular expression hasn't matched anything yet.''')
+            if len(items) > 0:
+                merged = _merge_repeats(items[-1], item)
+                if merged is not None:
+                    items[-1] = merged
+                    continue
 
-        return self.g.group(*args)
+            items.append(item)
 
+        result = _concat(items)
 
-    def __call__(self, *args, **kwargs):
-        # for supporting d.integer and d.integer(capture='foo')
-        return Dinant(self, *args, **kwargs)
+    elif isinstance(node, _Group):
+        result = _Group(node.kind, _safe(node.child, done), node.name, node.type)
+
+    elif isinstance(node, _Repeat):
+        child = _safe(node.child, done)
+        if _is_non_capturing(child):
+            child = child.child
+
+        if ( isinstance(child, _Repeat) and node.max is None and child.max is None and
+             node.min in (0, 1) and child.min in (0, 1) and node.greedy == child.greedy and
+             node.possessive == child.possessive ):
+            # (?:a+)+ is a+, (?:a+)* and (?:a*)+ are a*
+            result = _Repeat(child.child, node.min * child.min, None, node.greedy, node.possessive)
+        else:
+            result = _Repeat(child, node.min, node.max, node.greedy, node.possessive)
+
+    elif isinstance(node, _Either):
+        # the same alternative again can only match what the first one did
+        branches = []
+        seen = set()
+
+        for branch in node.branches:
+            branch = _safe(branch, done)
+            string = _flatten(branch)
+
+            if string in seen and not _has_captures(branch):
+                continue
+
+            seen.add(string)
+            branches.append(branch)
+
+        result = _simplify_either(branches)
+
+    else:
+        result = node
+
+    done[key] = result
+
+    return result
+
+
+def _merge_repeats(left, right):
+    """\\d+\\d* is \\d+, \\d+\\d is \\d{2,}. Returns None if they can't be merged."""
+    if not isinstance(left, _Repeat) and not isinstance(right, _Repeat):
+        return None
+
+    left = left if isinstance(left, _Repeat) else _Repeat(left, 1, 1)
+    right = right if isinstance(right, _Repeat) else _Repeat(right, 1, 1)
+
+    # \\d++\\d+ never matches, the first one takes all the digits; and a|b(?:a|b)*
+    # is not (?:a|b)+, the | splits the whole concatenation
+    if ( left.greedy != right.greedy or left.possessive or right.possessive or
+         _flatten(left.child) != _flatten(right.child) or _has_captures(left.child) or
+         _has_alternation(left.child) or _has_alternation(right.child) ):
+        return None
+
+    maximum = None if left.max is None or right.max is None else left.max + right.max
+
+    return _Repeat(left.child, left.min + right.min, maximum, left.greedy)
 
 
 anything = Dinant('.', escape=False)
@@ -195,73 +3343,96 @@ def wrap(left, middle, right):
 
 
 def any_of(s):
-    """s must be in the right format.
+    """s must be in the right format, or a CharClass.
     See https://docs.python.org/3/library/re.html#regular-expression-syntax ."""
-    return wrap('[', Dinant(s, escape=False), ']')
+    if isinstance(s, CharClass):
+        return Dinant(s)
+
+    return Dinant(_Class(s))
 
 # another helper function
 def captures(kwargs):
-    return ('capture' in kwargs and kwargs['capture']) or 'name' in kwargs
+    return ('capture' in kwargs and kwargs['capture']) or 'name' in kwargs or kwargs.get('type', None) is not None
 
 def either(*args, **kwargs):
-    # TODO: this is the only point where we pre compact
-    inner = Dinant('|'.join([ str(Dinant(s) if isinstance(s, str) else s) for s in args ]), escape=False)
+    trie = None
+    if len(args) > 1 and all(isinstance(s, str) for s in args):
+        trie = _trie(args)
+
+    if trie is not None:
+        # all literals, none a prefix of a later one: the trie matches the same
+        inner = _trie_node(trie)
+    else:
+        branches = _merge_classes([ _node(s) for s in args ])
+        # a class, a character or a group don't need another one around them
+        inner = branches[0] if len(branches) == 1 and branches[0].atomic else _Either(branches)
+
     # optimization: check if capturing
     if captures(kwargs):
         return capture(inner, **kwargs)
+    elif isinstance(inner, _Either):
+        return Dinant(_Group('(?:', inner))
+    else:
+        return Dinant(inner)
+
+
+def either_words(*words, **kwargs):
+    """Like either(), but all the arguments must be strings and it matches the
+    longest of them. It's faster than either() for big lists of words, because
+    it's matched as a trie."""
+    inner = _trie_node(_trie(words, longest=True))
+
+    if captures(kwargs):
+        return capture(inner, **kwargs)
+    elif isinstance(inner, _Either):
+        return Dinant(_Group('(?:', inner))
     else:
-        return wrap('(?:', inner, ')')
+        return Dinant(inner)
 
 
-def capture(s, capture=True, name=None):
+def capture(s, capture=True, name=None, type=None):
     # ugh
     name = name if name is not None else (capture if isinstance(capture, str) else None)
+    if type is not None:
+        type = _type(type, s if isinstance(s, Dinant) else None)
 
     if name is None:
-        return wrap('(', Dinant(s), ')')
+        return Dinant(_Group('(', _node(s), type=type))
     else:
-        return wrap('(?P', wrap('<', name, '>',) + Dinant(s), ')')
+        return Dinant(_Group('(?P<', _node(s), name, type))
 
 
 def backref(name):
-    return wrap('(?P=', Dinant(name), ')')
+    return Dinant(_Backref(name))
 
 def comment(text):
-    return wrap('(?# ', Dinant(text), ' )')
+    return Dinant('(?# %s )' % re.escape(text), escape=False)
 
 def lookahead(s):
-    return wrap('(?=', Dinant(s), ')')
+    return Dinant(_Group('(?=', _node(s)))
 
 def neg_lookahead(s):
-    return wrap('(?!', Dinant(s), ')')
+    return Dinant(_Group('(?!', _node(s)))
 
 def lookbehind(s):
-    return wrap('(?<=', Dinant(s), ')')
+    return Dinant(_Group('(?<=', _node(s)))
 
 def neg_lookbehind(s):
-    return wrap('(?<!', Dinant(s), ')')
+    return Dinant(_Group('(?<!', _node(s)))
 
 # TODO: make these check lengths and use (?:...) only if > 1
-def one_or_more(s, greedy=True):
-    result = wrap('(?:', Dinant(s), ')+')
-    if not greedy:
-        result += Dinant('?', escape=False)
-
-    return result
-
-def zero_or_more(s, greedy=True):
-    result = wrap('(?:', Dinant(s), ')*')
-    if not greedy:
-        result += Dinant('?', escape=False)
+def one_or_more(s, greedy=True, possessive=False):
+    return Dinant(_Repeat(_Group('(?:', _node(s)), 1, None, greedy, possessive))
 
-    return result
+def zero_or_more(s, greedy=True, possessive=False):
+    return Dinant(_Repeat(_Group('(?:', _node(s)), 0, None, greedy, possessive))
 
-def maybe(s, greedy=True):
-    result = wrap('(?:', Dinant(s), ')?')
-    if not greedy:
-        result += Dinant('?', escape=False)
+def maybe(s, greedy=True, possessive=False):
+    return Dinant(_Repeat(_Group('(?:', _node(s)), 0, 1, greedy, possessive))
 
-    return result
+def atomic(s):
+    # once it matched, the engine does not backtrack into it
+    return Dinant(_Group('(?>', _node(s)))
 
 then = Dinant
 text = Dinant
@@ -270,104 +3441,594 @@ bol = Dinant('^', escape=False)
 eol = Dinant('$', escape=False)
 
 def none_of(s):
-    return wrap('[^', Dinant(s), ']')
+    if isinstance(s, CharClass):
+        return Dinant(~s)
 
-def exactly(n, s):
-    return s + wrap('{', str(n), '}')
+    return Dinant(_Class(s, negated=True))
 
-def between(m, n, s, greedy=True):
+def exactly(n, s, possessive=False):
+    return Dinant(_Repeat(_node(s), n, n, possessive=possessive))
+
+def between(m, n, s, greedy=True, possessive=False):
     if m is None or m is Ellipsis:
-        m = ''
-    if n is None or n is Ellipsis:
-        n = ''
+        m = 0
+    if n is Ellipsis:
+        n = None
 
-    result =  s + wrap('{', Dinant("%s,%s" % (m, n), escape=False), '}')
-    if not greedy:
-        result += '?'
+    return Dinant(_Repeat(_node(s), m, n, greedy, possessive))
+
+def at_most(n, s, greedy=True, possessive=False):
+    return between(None, n, s, greedy, possessive)
+
+def at_least(n, s, greedy=True, possessive=False):
+    return between(n, None, s, greedy, possessive)
 
-    return result
 
-def at_most(n, s, greedy=True):
-    return between(None, n, s, greedy)
+def typed(regexp, type):
+    """Returns a copy of regexp whose type is type, so captures of it can be
+    converted with type=True."""
+    result = Dinant(regexp)
+    result.type = type
 
-def at_least(n, s, greedy=True):
-    return between(n, None, s, greedy)
+    return result
 
 
 # useful shit
 digit = Dinant('\d', escape=False)
 digits = digit
-uint = one_or_more(digits)
 _int = int
-int = maybe(any_of('+-')) + uint
-integer = int
-# NOTE: the order is important or the regexp stops at the first match
-float = ( either(maybe(any_of('+-')) + maybe(one_or_more(digits)) + then('.') + one_or_more(digits),
-                 integer + then('.'),
-                 integer) +
-          maybe(any_of('Ee') + maybe(any_of('+-')) + one_or_more(digits)) )
-hex = one_or_more(any_of('0-9A-Fa-f'))
-hexa = hex
+_float = float
+_nan = _float('nan')
+# type of a capture -> typecode of its column's array; hex's is a partial() of int
+_array_codes = { _int: 'q', _float: 'd' }
+
+# the rest are built the first time they're used, see __getattr__()
+# name -> function that builds it
+__builders = {}
+__lazy_lock = threading.RLock()
+
+def __getattr__(name):
+    try:
+        build = __builders[name]
+    except KeyError:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name)) from None
+
+    with __lazy_lock:
+        # other thread might have been faster
+        if name not in globals():
+            globals()[name] = build()
+
+    return globals()[name]
+
+def __dir__():
+    return list(globals()) + list(__builders)
+
+def _standard(name):
+    """Use this for getting the lazy ones from inside the module."""
+    return getattr(sys.modules[__name__], name)
+
+def _lazy(name):
+    def decorator(build):
+        __builders[name] = build
+        return build
+
+    return decorator
+
+
+@_lazy('uint')
+def _uint():
+    return typed(one_or_more(digits), _int)
+
+@_lazy('int')
+def _integer():
+    return typed(maybe(any_of('+-')) + _standard('uint'), _int)
+
+_lazy('integer')(lambda: _standard('int'))
+
+@_lazy('float')
+def _float_re():
+    integer = _standard('integer')
+
+    # NOTE: the order is important or the regexp stops at the first match
+    return typed( either(maybe(any_of('+-')) + maybe(one_or_more(digits)) + then('.') + one_or_more(digits),
+                         integer + then('.'),
+                         integer) +
+                  maybe(any_of('Ee') + maybe(any_of('+-')) + one_or_more(digits)),
+                  _float )
+
+@_lazy('hex')
+def _hex():
+    return typed(one_or_more(any_of('0-9A-Fa-f')), partial(_int, base=16))
+
+_lazy('hexa')(lambda: _standard('hex'))
 # TODO: octal
 
 # fallback
 regexp = partial(Dinant, escape=False)
 
-# NOTE: none of these regexps do any value checking (%H between 00-23, etc)
-__dt_format_to_re = {
-    '%a': one_or_more(anything, greedy=False),  # TODO: this is not really specific
-    '%A': one_or_more(anything, greedy=False),  # TODO: this is not really specific
-    '%b': one_or_more(anything, greedy=False),  # TODO: this is not really specific
-    '%B': one_or_more(anything, greedy=False),  # TODO: this is not really specific
-    '%d': exactly(2, digits),
-    '%H': exactly(2, digits),
-    '%I': exactly(2, digits),
-    '%j': exactly(3, digits),
-    '%m': exactly(2, digits),
-    '%M': exactly(2, digits),
-    '%p': one_or_more(anything, greedy=False),  # TODO: this is not really specific
-    '%S': exactly(2, digits),
-    '%U': exactly(2, digits),
-    '%w': digit,
-    '%W': exactly(2, digits),
-    '%y': exactly(2, digits),
-    '%Y': exactly(4, digits),
-    '%z': either('+', '-') + exactly(4, digits),
-    '%%': '%',
-    }
+# these only match valid values (%H between 00-23, etc), so bad timestamps are
+# rejected by the regexp and not by strptime(); names are the current locale's
+def _names(names):
+    # like strptime()
+    return Dinant(either_words(*names), flags=IGNORECASE)
+
+@_lazy('__dt_format_to_re')
+def _dt_format_to_re():
+    hours = either(any_of('01') + digit, '2' + any_of('0-3'))
+    minutes = any_of('0-5') + digit
+
+    return {
+        '%a': _names(calendar.day_abbr),
+        '%A': _names(calendar.day_name),
+        '%b': _names(calendar.month_abbr[1:]),
+        '%B': _names(calendar.month_name[1:]),
+        '%d': either('0' + any_of('1-9'), any_of('12') + digit, '3' + any_of('01')),
+        '%f': between(1, 6, digits, possessive=True),
+        '%H': hours,
+        '%I': either('0' + any_of('1-9'), '1' + any_of('0-2')),
+        '%j': either('00' + any_of('1-9'), '0' + any_of('1-9') + digit, any_of('12') + exactly(2, digits),
+                     '3' + any_of('0-5') + digit, '36' + any_of('0-6')),
+        '%m': either('0' + any_of('1-9'), '1' + any_of('0-2')),
+        '%M': minutes,
+        '%p': _names(_datetime.time(hour).strftime('%p') for hour in (0, 12)),
+        # leap seconds, and double leap seconds, which never happen but strptime() accepts
+        '%S': either(minutes, '6' + any_of('01')),
+        '%U': either(any_of('0-4') + digit, '5' + any_of('0-3')),
+        '%w': any_of('0-6'),
+        '%W': either(any_of('0-4') + digit, '5' + any_of('0-3')),
+        '%y': exactly(2, digits),
+        '%Y': exactly(4, digits),
+        '%z': either('Z', any_of('+-') + hours + maybe(':') + minutes),
+        '%%': '%',
+        }
 
 # date/time
 # NOTE: this must be kept in sync with
 # https://docs.python.org/3/library/time.html#time.strptime
-def datetime(s="%a %b %d %H:%M:%S %Y", buggy_day=False):
+def datetime(s="%a %b %d %H:%M:%S %Y", buggy_day=False, cached=False):
+    """Matches timestamps with strptime()'s format s; see above. Its type converts
+    them with strptime(), or, if cached is True, with a _TimestampParser."""
     for fmt in ('%c', '%x', '%X'):
         if fmt in s:
             raise ValueError('%r not supported.' % fmt)
 
-    if buggy_day and '%d' in s:
-        # Apr  7 07:46:44
-        #     ^^
-        s = s.replace('%d', str(either(' '+digit, exactly(2, digits))))
+    dt_format_to_re = _standard('__dt_format_to_re')
+    nodes = []
+    # the format is split in directives and the text between them, which is kept as is
+    for piece in re.split('(%.)', s):
+        if piece == '':
+            continue
+
+        if buggy_day and piece == '%d':
+            # Apr  7 07:46:44
+            #     ^^
+            regexp = either(' ' + any_of('1-9'), dt_format_to_re['%d'])
+        else:
+            regexp = dt_format_to_re.get(piece, None)
+
+        if regexp is None:
+            nodes.append(_Regexp(piece))
+        else:
+            nodes.append(_node(regexp))
+
+    result = Dinant('')
+    for node in nodes:
+        result += Dinant(node)
+
+    if cached:
+        return typed(result, _TimestampParser(s, buggy_day))
+
+    return typed(result, _decoding(partial(_strptime, format=s)))
+
+
+def _strptime(value, format):
+    return _datetime.datetime.strptime(value, format)
+
+
+class _TimestampParser:
+    """Converts timestamps like strptime(), but remembers the last one, because
+    consecutive lines of a log usually have the same. If the format has
+    microseconds (%f), it remembers the rest of it, so only the microseconds
+    change."""
+
+    def __init__(self, format, buggy_day=False):
+        self.format = format
+        # (the timestamp without microseconds, its datetime); replaced at once,
+        # so it can be shared between threads
+        self.last = (None, None)
+        self.fraction = None
+
+        pieces = re.split('(%.)', format)
+        if '%f' in pieces:
+            index = pieces.index('%f')
+            fraction = ( datetime(''.join(pieces[:index]), buggy_day) +
+                         capture(between(1, 6, digits)) +
+                         datetime(''.join(pieces[index + 1:]), buggy_day) )
+            self.fraction = re.compile(str(fraction.simplify()))
+
+    def __call__(self, value):
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+
+        key, result = self.last
+        if self.fraction is None:
+            if value == key:
+                return result
+
+            key = value
+        else:
+            match = self.fraction.fullmatch(value)
+            if match is not None:
+                start, end = match.span(1)
+                if value[:start] + value[end:] == key:
+                    return result.replace(microsecond=_int(match.group(1).ljust(6, '0')))
+
+                key = value[:start] + value[end:]
+            else:
+                key = None
+
+        result = _strptime(value, self.format)
+        self.last = (key, result)
+
+        return result
+
+    def __repr__(self):
+        return '_TimestampParser(%r)' % self.format
+
+
+@_lazy('__octet')
+def _octet():
+    # the longest first, or 255 would match as 25
+    return either('25' + any_of('0-5'), '2' + any_of('0-4') + digit, '1' + exactly(2, digits),
+                  maybe(any_of('1-9')) + digit)
+
+@_lazy('IPv4')
+def _IPv4():
+    octet = _standard('__octet')
+
+    return typed( octet + '.' + octet + '.' + octet + '.' + octet,
+                  _decoding(ipaddress.ip_address) )
+
+@_lazy('IPv6')
+def _IPv6():
+    # RFC 3986's IPv6address, but rearranged so each choice is made by looking at
+    # the next character or two, instead of trying nine alternatives in turn
+    IPv4 = _standard('IPv4')
+    h16 = between(1, 4, any_of('0-9A-Fa-f'))
+    h16_ = h16 + ':'
+
+    def after(n):
+        # up to n groups after ::, the last two of them can be an IPv4
+        if n == 0:
+            return Dinant('')
+        elif n == 1:
+            return maybe(h16)
+        else:
+            return maybe(either(at_most(n - 2, h16_) + IPv4, at_most(n - 1, h16_) + h16))
+
+    def rest(n):
+        # what can follow n groups
+        if n == 8:
+            return Dinant('')
+        elif n == 6:
+            return either(':' + IPv4, ':' + h16 + rest(n + 1), '::' + after(1))
+        else:
+            return either(':' + h16 + rest(n + 1), '::' + after(7 - n))
+
+    return typed(either('::' + after(7), h16 + rest(1)), _decoding(ipaddress.ip_address))
+
+@_lazy('IP_number')
+def _IP_number():
+    IPv4 = _standard('IPv4')
+
+    return typed(either(IPv4, _standard('IPv6')), IPv4.type)
+
+def _ip_port(value):
+    ip, port = value.rsplit(':', 1)
+    # [::1]:80
+    return (ipaddress.ip_address(ip.strip('[]')), _int(port))
+
+@_lazy('IP_port')
+def _IP_port():
+    port = _standard('uint')
+
+    return typed(either(_standard('IPv4') + ':' + port, '[' + _standard('IPv6') + ']:' + port),
+                 _decoding(_ip_port))
+
+
+# ahead of time compilation
+def generate_module(module, name=None):
+    """Returns the source of a module with the expressions defined in module as
+    constants: for each, its simplified regexp, its flags and the names of its
+    groups (None for unnamed ones). Importing it does not need dinant."""
+    lines = [
+        '# generated by python3 -m dinant compile %s, do not edit' % (name or module.__name__),
+        '',
+        ]
+
+    # dir() so the standard expressions are included if module is this one;
+    # otherwise they were imported from here, like with from dinant import *
+    this = module.__dict__ is globals()
+    for attr in dir(module):
+        value = getattr(module, attr)
+        if attr.startswith('_') or not isinstance(value, Dinant):
+            continue
+        if not this and value is globals().get(attr, None):
+            continue
+
+        pattern = value._compile()
+        groups = [ None ] * pattern.groups
+        for group, index in pattern.groupindex.items():
+            groups[index - 1] = group
+
+        lines.append('%s = %r' % (attr, str(value.simplify())))
+        lines.append('%s_flags = %r' % (attr, _int(value.flags)))
+        lines.append('%s_groups = %r' % (attr, tuple(groups)))
+        lines.append('')
+
+    return '\n'.join(lines)
+
+
+def _load_module(spec):
+    """Imports a module by name, or from a file if spec ends with .py."""
+    if spec.endswith('.py'):
+        import importlib.util
+
+        name = os.path.splitext(os.path.basename(spec))[0]
+        module_spec = importlib.util.spec_from_file_location(name, spec)
+        module = importlib.util.module_from_spec(module_spec)
+        module_spec.loader.exec_module(module)
+
+        return module
+    else:
+        import importlib
+
+        return importlib.import_module(spec)
+
+
+def _compile_main(args):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python3 -m dinant compile',
+                                     description="Writes a module with the regexps of the expressions in another.")
+    parser.add_argument('module', help='module name, or path to a .py file.')
+    parser.add_argument('-o', '--output', help='where to write it; by default, stdout.')
+    args = parser.parse_args(args)
+
+    source = generate_module(_load_module(args.module), args.module)
+
+    if args.output is None:
+        print(source)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(source)
+
+
+# grep
+def _evaluate(s):
+    """Evaluates s, a Python expression, with all of dinant in scope."""
+    for name in __builders:
+        _standard(name)
+
+    return eval(s, globals())
+
+
+def _lines(f, binary):
+    """Yields the lines in f without the newline."""
+    newline = b'\n' if binary else '\n'
+
+    for line in f:
+        if line.endswith(newline):
+            line = line[:-1]
+
+        yield line
+
+
+def _field(value):
+    """Converts a capture for the TSV output."""
+    if value is None:
+        return ''
+    elif isinstance(value, bytes):
+        value = value.decode('utf-8', errors='backslashreplace')
+    else:
+        value = str(value)
+
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+def _json_default(value):
+    """Converts the captures json does not know how to (bytes, datetimes, IPs...)."""
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='backslashreplace')
+    else:
+        return str(value)
+
+
+def _whole_line(expression):
+    """Returns expression anchored at the end too, for matching whole lines like
+    grep -x. The group keeps its alternatives, if any, inside."""
+    return Dinant(_Concat((_Group('(?:', _node(expression)), _Regexp('\\Z'))), flags=expression.flags)
+
+
+def _grep_main(args):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python3 -m dinant grep',
+                                     description='Prints the lines of the files (or stdin) that match an expression, or their named captures.')
+    parser.add_argument('args', nargs='*', metavar='EXPRESSION [FILE',
+                        help="the expression, like \"bol + integer(capture='n')\" (not with --module) and the files to read; - or none for stdin.")
+    parser.add_argument('-m', '--module', help='use the expressions in this module (name or path to a .py file) as a RuleSet.')
+    parser.add_argument('-p', '--patterns', help='comma separated names of the expressions to use from the module (default: all).')
+    parser.add_argument('-f', '--format', choices=('lines', 'tsv', 'jsonl'), default='lines',
+                        help='print the matching lines, or the named captures as tab separated values or JSON Lines (default: %(default)s).')
+    parser.add_argument('--header', action='store_true', help='print the names of the captures first, for tsv.')
+    parser.add_argument('-c', '--count', action='store_true', help='only print how many lines matched.')
+    parser.add_argument('-n', '--line-number', action='store_true', help='also print the line numbers.')
+    parser.add_argument('-x', '--line-regexp', action='store_true', help='the expression must match the whole line.')
+    parser.add_argument('-b', '--bytes', action='store_true', help='read and match bytes, without decoding the lines.')
+    parser.add_argument('-j', '--jobs', type=_int, default=1, help='how many processes match the lines (default: %(default)s).')
+    # so the files can go after the options
+    args = parser.parse_intermixed_args(args)
+
+    if args.module is not None:
+        module = _load_module(args.module)
+        if args.patterns is not None:
+            names = args.patterns.split(',')
+        else:
+            # not the ones imported from here
+            names = [ name for name in dir(module)
+                      if not name.startswith('_') and isinstance(getattr(module, name), Dinant) and
+                         getattr(module, name) is not globals().get(name, None) ]
+
+        rules = [ (name, getattr(module, name)) for name in names ]
+        if args.line_regexp:
+            rules = [ (name, _whole_line(rule)) for name, rule in rules ]
+
+        expression = RuleSet(rules)
+        files = args.args
+    else:
+        if len(args.args) == 0:
+            parser.error('an expression or --module is needed.')
+
+        try:
+            expression = _evaluate(args.args[0])
+        except Exception as error:
+            parser.error('invalid expression %r: %s' % (args.args[0], error))
+
+        if isinstance(expression, str):
+            expression = Dinant(expression)
+        if args.line_regexp:
+            expression = _whole_line(expression)
+
+        files = args.args[1:]
+
+    if args.jobs > 1 and isinstance(expression, RuleSet):
+        parser.error("--jobs can't be used with --module.")
+
+    if len(files) == 0:
+        files = [ '-' ]
+
+    # group names in order, for the tsv header and columns
+    if isinstance(expression, RuleSet):
+        columns = None
+    else:
+        groupindex = expression._pattern(b'' if args.bytes else '').groupindex
+        columns = sorted(groupindex, key=groupindex.get)
+
+    out = sys.stdout
+    if args.header and args.format == 'tsv' and columns is not None:
+        header = ([ 'file' ] if len(files) > 1 else []) + ([ 'line' ] if args.line_number else []) + columns
+        out.write('\t'.join(header) + '\n')
+
+    try:
+        found = _grep(expression, files, columns, args, out)
+    except BrokenPipeError:
+        # the reader is gone, like with | head; python would complain again when
+        # flushing stdout at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), out.fileno())
+        return 1
+
+    # like grep
+    return 0 if found else 1
+
+
+def _grep(expression, files, columns, args, out):
+    """Does the work for _grep_main(); returns whether any line matched."""
+    import json
+
+    found = False
+
+    for path in files:
+        if path == '-':
+            f = sys.stdin.buffer if args.bytes else sys.stdin
+        else:
+            f = open(path, 'rb') if args.bytes else open(path, errors='replace')
+
+        try:
+            if args.jobs > 1:
+                # the lines are sent to the other processes, so keep a copy for printing them;
+                # parallel_match() consumes them only as needed, so this does not grow much
+                lines = deque()
+
+                def keep(lines, source):
+                    for line in source:
+                        lines.append(line)
+                        yield line
+
+                matches = expression.parallel_match(keep(lines, _lines(f, args.bytes)),
+                                                    search=not args.line_regexp, processes=args.jobs)
+                results = ((lines.popleft(), match) for match in matches)
+            else:
+                method = expression.match if args.line_regexp else expression.search
+                results = ((line, method(line)) for line in _lines(f, args.bytes))
+
+            count = 0
+            for number, (line, match) in enumerate(results, 1):
+                if match is None:
+                    continue
+
+                count += 1
+                if args.count:
+                    continue
+
+                prefix = []
+                if len(files) > 1:
+                    prefix.append(path)
+                if args.line_number:
+                    prefix.append(str(number))
+
+                if isinstance(match, RuleMatch):
+                    rule, groups = match.rule, match.groups
+                    prefix.append(rule)
+                else:
+                    groups = { name: match.group(name) for name in columns }
+
+                if args.format == 'lines':
+                    if args.bytes:
+                        out.flush()
+                        out.buffer.write(b''.join(field.encode() + b':' for field in prefix) + line + b'\n')
+                    else:
+                        out.write(''.join(field + ':' for field in prefix) + line + '\n')
+                elif args.format == 'tsv':
+                    out.write('\t'.join(prefix + [ _field(value) for value in groups.values() ]) + '\n')
+                else:
+                    record = {}
+                    if len(files) > 1:
+                        record['file'] = path
+                    if args.line_number:
+                        record['line'] = number
+                    if isinstance(match, RuleMatch):
+                        record['rule'] = rule
 
-    # TODO: support escaped %%a
-    for fmt, regexp in __dt_format_to_re.items():
-        # another instance of pre compacting
-        s = s.replace(fmt, str(regexp))
+                    record.update(groups)
+                    out.write(json.dumps(record, default=_json_default) + '\n')
 
-    return Dinant(s, escape=False)
+            if args.count:
+                out.write('%s:%d\n' % (path, count) if len(files) > 1 else '%d\n' % count)
 
-# TODO: support the real vales
-IPv4 = ( between(1, 3, digits) + '.' +
-         between(1, 3, digits) + '.' +
-         between(1, 3, digits) + '.' +
-         between(1, 3, digits) )
+            found = found or count > 0
+        finally:
+            if path != '-':
+                f.close()
 
-IP_number = either(IPv4)  # TODO IPv6
+    out.flush()
 
-IP_port = IP_number + ':' + integer
+    return found
 
 
 def run_tests():
+    import asyncio
+    import contextlib
+    import io
+    import itertools
+    import pickle
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    # the standard expressions are used as globals here, so build them
+    for name in __builders:
+        _standard(name)
+
     def ass(x, y=True):
         try:
             assert x == y
@@ -377,7 +4038,7 @@ def run_tests():
 
     def test(regexp, src, dst=None, capt=True):
         try:
-            if (regexp[0] != '(' or regexp[:3] == '(?:') and capt:
+            if (regexp[0] != '(' or regexp[:2] == '(?' and regexp[:4] != '(?P<') and capt:
                 regexp = capture(regexp)
 
             if dst is not None:
@@ -481,6 +4142,38 @@ def run_tests():
     test(IP_number, '10.33.1.53', ('10.33.1.53', ))
     test(IP_port, '10.33.1.53:60928', ('10.33.1.53:60928', ))
 
+    # only valid values
+    test(bol + datetime() + eol, 'fri APR 28 23:59:60 2017', ('fri APR 28 23:59:60 2017', ))
+    test(bol + datetime() + eol, 'Fri Apr 28 24:00:00 2017')
+    test(bol + datetime() + eol, 'Fri Apr 32 13:34:19 2017')
+    test(bol + datetime() + eol, 'Fri Abr 28 13:34:19 2017')
+    test(bol + datetime('%b %d %H:%M:%S', buggy_day=True) + eol, 'Apr  0 13:34:19')
+    test(bol + datetime('%H:%M:%S.%f%z') + eol, '13:34:19.5+02:00', ('13:34:19.5+02:00', ))
+    test(bol + datetime('%m/%d %I%p') + eol, '12/31 11pm', ('12/31 11pm', ))
+    test(bol + datetime('%m/%d %I%p') + eol, '13/31 11pm')
+    test(bol + IPv4 + eol, '255.249.0.10', ('255.249.0.10', ))
+    test(bol + IPv4 + eol, '10.0.0.256')
+    test(bol + IPv4 + eol, '10.0.0.01')
+    for ip in ('::', '::1', 'fe80::1:2', '2001:db8::8a2e:370:7334', '1:2:3:4:5:6:7:8', '::ffff:10.0.0.1'):
+        test(bol + IPv6 + eol, ip, (ip, ))
+        ass(IP_number(type=True).match(ip).group(1), ipaddress.ip_address(ip))
+
+    for ip in ('1:2:3:4:5:6:7:8:9', '1::2::3', '12345::', '::ffff:10.0.0.256'):
+        test(bol + IPv6 + eol, ip)
+
+    ass(IP_port(type=True).match('[::1]:8080').group(1), (ipaddress.ip_address('::1'), 8080))
+    ass((bol + IP_port + eol).match('::1:8080'), None)
+
+    # cached timestamps
+    timestamp = datetime('%Y-%m-%d %H:%M:%S,%f', cached=True)
+    ass(timestamp.type('2017-04-28 13:34:19,5'), _datetime.datetime(2017, 4, 28, 13, 34, 19, 500000))
+    ass(timestamp.type(b'2017-04-28 13:34:19,123'), _datetime.datetime(2017, 4, 28, 13, 34, 19, 123000))
+    ass(timestamp.type('2017-04-28 13:34:20,123'), _datetime.datetime(2017, 4, 28, 13, 34, 20, 123000))
+    timestamp = datetime('%b %d %H:%M:%S', cached=True)(capture='t', type=True)
+    ass(timestamp.match('Apr 28 13:34:19').group('t'), _datetime.datetime(1900, 4, 28, 13, 34, 19))
+    ass(timestamp.match('Apr 28 13:34:19').group('t'), _datetime.datetime(1900, 4, 28, 13, 34, 19))
+    ass(timestamp.match('Apr 28 13:34:21').group('t'), _datetime.datetime(1900, 4, 28, 13, 34, 21))
+
 
     # real life examples
     def timestamp_re(capt=True):
@@ -535,6 +4228,19 @@ def run_tests():
     render_time_partial_match_re = ( bol + capture(float, name='wall_time') + 'ms ' +
                                      '(cpu' + capture(float, name='cpu_time') )
     ass(render_time_re.debug(line), str(render_time_partial_match_re))
+    ass(render_time_re.debug(line.encode()), bytes(render_time_partial_match_re))
+    ass((bol + float + 'ms').debug(line), True)
+    ass(( bol + regexp('(') + 'a' + regexp(')') + 'b' ).debug('ac'), '^(a)b')
+    ass(( bol + regexp('(') + 'a' + regexp(')') + 'b' ).debug('c'), '^(a)')
+
+    results = render_time_re.debug_lines([ line, '12ms (cpu 1ms)', 'foo', b'12ms (cpu 1ms)' ])
+    ass(results[0].index, 4)
+    ass(results[0].subexpression, str(capture(float, name='cpu_time')))
+    ass(results[0].prefix, str(render_time_partial_match_re))
+    ass(results[1].index, 4)
+    ass(results[2].index, 1)
+    ass(results[3].prefix, bytes(render_time_partial_match_re))
+    ass((bol + float + 'ms').debug_lines([ line ]), [ None ])
 
     # capture
     test('bc' + Dinant('a', capture='a') + 'de', 'bcade', ('bcade', 'a'))
@@ -578,6 +4284,575 @@ def run_tests():
     test(between(1, None, digit), '')
     test(between(1, None, digit), '1', ('1', ))
     test(between(1, None, digit), '1234567890', ('1234567890', ))
+    test(between(1, 3, digit, greedy=False), '123', ('1', ))
+    test(exactly(2, 'ab'), 'abab', ('abab', ))
+    test(exactly(2, 'ab'), 'abb')
+
+    test(none_of('a-z'), '-', ('-', ))
+    test(none_of('a-z'), 'b')
+
+    # subexpressions are shared, not copied
+    ass(str(float + float), str(float) * 2)
+    ass((float + 'a').node.items[0] is float.node)
+
+    # simplify
+    ass(str(subexp.simplify()), '([a-z]+)(?:\\[([a-z]*)\\])*')
+    ass(str(integer.simplify()), '[+-]?\\d+')
+    ass(str(either('a', 'b', digit).simplify()), '[ab\\d]')
+    ass(str(either('abc', 'abd', 'e', capture=True).simplify()), '(ab[cd]|e)')
+    ass(str(either('a', 'ab').simplify()), 'a(?:|b)')
+    ass(str(maybe(bol).simplify()), '(?:^)?')
+    # alternations keep their groups
+    ass(str((then('x') + exactly(1, either('ab', 'cd'))).simplify()), 'x(?:ab|cd)')
+    ass((then('x') + exactly(1, either('ab', 'cd'))).match('cd'), None)
+    ass(str((then('x') + exactly(1, regexp('a|b'))).simplify()), 'x(?:a|b)')
+    ass(str((then('x') + Dinant(_Group('(?:', _Regexp('a|b')))).simplify()), 'x(?:a|b)')
+    ass((then('x') + Dinant(_Group('(?:', _Regexp('a|b')))).match('b'), None)
+    ass(str((then('x') + Dinant(_Group('(?:', _Regexp('a\\d')))).simplify()), 'xa\\d')
+
+    # cache
+    cache_clear()
+    ass(float.match('1.5') is not None)
+    ass(float(capture=True).matches('1.5'))
+    ass(float(capture=True).search('1.5') is not None)
+    ass(cache_info(), CacheInfo(hits=1, misses=2, maxsize=1024, currsize=2))
+    set_cache_size(1)
+    ass(cache_info().currsize, 1)
+    set_cache_size(1024)
+
+    # flags
+    test(Dinant('abc', flags=IGNORECASE), 'ABC', ('ABC', ))
+    test(bol + Dinant('abc', flags=IGNORECASE) + 'def', 'ABCdef', ('ABCdef', ))
+    test(bol + Dinant('abc', flags=IGNORECASE) + 'def', 'ABCDEF')
+    ass(str(bol + Dinant('abc', flags=IGNORECASE)), '^(?i:abc)')
+    ass(Dinant('abc').match('ABC', flags=IGNORECASE) is not None)
+    ass(Dinant('abc').search('xABC') is None)
+    ass(Dinant('abc').search('xABC', IGNORECASE) is not None)
+    ass(anything(flags=DOTALL).match('\n') is not None)
+
+    # bytes
+    ass(bytes(then('a.b') + digit), b'a\\.b\\d')
+    ass(float(capture='f').match(b'-1.5e3').group('f'), b'-1.5e3')
+    ass(Dinant('é', times=2).match('é'.encode() * 2) is not None)
+    ass(Dinant('é', times=2).match(b'\xc3\xa9\xa9') is None)
+    ass(render_time_re.match(line.encode()).group('layer'), b'terrain-small')
+    # non ASCII classes match the UTF-8 encodings of their characters
+    ass(either('é', 'ü').match('é'.encode()).group(), 'é'.encode())
+    ass(bytes(any_of('a-cé')), b'(?:[\\x61-\\x63]|\\xc3\\xa9)')
+    ass(none_of('é')(times=2).match('aü'.encode()).group(), 'aü'.encode())
+    ass(none_of('é')(times=2).match('aé'.encode()), None)
+    # same str, different bytes
+    ass(regexp('é{2}').match(b'\xc3\xa9\xa9').group(), b'\xc3\xa9\xa9')
+    ass(Dinant('é', times=2).match('éé'.encode()).group(), 'éé'.encode())
+    ass(regexp('[é]').match('é'.encode()).group(), b'\xc3')
+    ass(any_of('é').match('é'.encode()).group(), 'é'.encode())
+    for chars in (any_of('a-cé-ü'), none_of('é\\d'), any_of(CharClass('\\x00-\\x08\\x85\\u2028')),
+                  any_of(CharClass('\\p{Greek}')), one_or_more(any_of('ñ-ó'))):
+        for char in 'abzéñóü9\x85\u2028αΩ\U0001f600':
+            ass(chars.match(char.encode()) is None, chars.match(char) is None)
+            if chars.match(char) is not None:
+                ass(chars.match(char.encode()).group(), char.encode())
+
+    # scan
+    with tempfile.NamedTemporaryFile(suffix='.log') as f:
+        f.write(b'foo\n' + line.encode() + b'\nbar\n' + line.encode() + b'\n')
+        f.flush()
+
+        found = list(render_time_re.scan(f.name))
+        ass([ (result.line, result.offset) for result in found ], [ (2, 4), (4, 4 + len(line) + 5) ])
+        ass(found[1].match.group('wall_time'), b'36569.12')
+
+    ass(_count_lines(b'a\nb\n\nc\n', 1, 9, window=2), 4)
+    ass(_count_lines(b'a\nb\n\nc\n', 2, 2), 0)
+
+    with tempfile.NamedTemporaryFile() as f:
+        ass(list(render_time_re.scan(f.name)), [])
+
+    # columns
+    ass(render_time_re.extract_all([ 'foo', line, 'bar', line ]),
+        dict(wall_time=[ '36569.12' ] * 2, cpu_time=[ '35251.71' ] * 2,
+             layer=[ 'terrain-small' ] * 2, style=[ 'terrain-small' ] * 2))
+    sample = bol + uint(capture='n', type=True) + ' ' + float(capture='f', type=True) + ' ' + \
+             maybe(hex(capture='h', type=True)) + ' ' + capture(one_or_more(any_of('a-z')), name='s')
+    columns = sample.extract_all('1 2.5 ff foo\nnope\n3 -1e3  bar\n', use_numpy=False)
+    ass(columns['n'], array('q', [ 1, 3 ]))
+    ass(columns['f'], array('d', [ 2.5, -1000.0 ]))
+    ass(columns['h'][0], 255.0)
+    ass(columns['h'][1] != columns['h'][1])
+    ass(columns['s'], [ 'foo', 'bar' ])
+    ass(sample.extract_all(b'1 2.5 ff foo', use_numpy=False)['s'], [ b'foo' ])
+    ass(sample.extract_all(iter([ b'1 2.5 ff foo' ]), use_numpy=False)['n'], array('q', [ 1 ]))
+    ass(sample.extract_all([], use_numpy=False), dict(n=array('q'), f=array('d'), h=array('d'), s=[]))
+    ass(list(sample.extract_all('7 1 a b')['n']), [ 7 ])
+    ass(sample(engine='linear').extract_all('1 2.5 ff foo', use_numpy=False)['f'], array('d', [ 2.5 ]))
+    ass(capture(digit, name='d').extract_all('1a2')['d'], [ '1', '2' ])
+    # the type of the column doesn't depend on whether some are empty
+    ass(sample.extract_all('1 2.5 ff foo', use_numpy=False)['h'], array('d', [ 255.0 ]))
+    optional = either(uint(capture='m', type=True), 'x')
+    ass(optional.extract_all('2 x', use_numpy=False)['m'][0], 2.0)
+    ass(optional.extract_all('2', use_numpy=False)['m'], array('d', [ 2.0 ]))
+    ass(_optional_groups((capture(digit) + maybe(capture(digit)) + capture(maybe(digit))).node), { 2, 3 })
+    ass(integer.extract_all('1 2'), {})
+
+    # typed captures
+    ass(integer(capture='n', type=int).match('-42').group('n'), -42)
+    ass(integer(type=int).match('-42').groups(), (-42, ))
+    ass(float(capture='f', type=True).match(b'1.5e3').group('f'), 1500.0)
+    ass(hex(capture='h', type=True).match('ff').group('h'), 255)
+    ass(hex(capture='h', type=len).match('ff').group('h'), 2)
+    ass(capture(IP_port, type=True).match('10.33.1.53:60928').group(1),
+        (ipaddress.ip_address('10.33.1.53'), 60928))
+    ass(IPv4(name='ip', type=True).match(b'10.33.1.53').group('ip'), ipaddress.ip_address('10.33.1.53'))
+    ass(datetime('%b %d %H:%M:%S', buggy_day=True)(capture='dt', type=True).match('Apr  8 13:34:19').group('dt'),
+        _datetime.datetime(1900, 4, 8, 13, 34, 19))
+    ass(either('a', 'b', name='x', type=str.upper).match('b').group('x'), 'B')
+    ass((integer(type=int) + 'x' + integer(type=int)).matches('1x2'))
+    ass((integer(type=int) + 'x' + integer(type=int)).match('1x2').group(1, 2), (1, 2))
+    ass(RuleSet(n=integer(name='n', type=int)).match('12').groups, dict(n=12))
+    ass(maybe(integer(type=int)).match('').groups(), (None, ))
+
+    # threads
+    def worker(i):
+        result = []
+        for j in range(200):
+            n = str(i * 1000 + j)
+            integer_re.matches(n)
+            result.append(integer_re.group('n') == _int(n) and
+                          integer_re.parse(n).group('n') == _int(n))
+
+        return all(result)
+
+    integer_re = bol + integer(capture='n', type=int) + eol
+    with ThreadPoolExecutor(8) as executor:
+        ass(all(executor.map(worker, range(8))))
+
+    ass(integer_re.parse('x'), None)
+    ass(integer_re.parse('x1', search=True), None)
+    ass(float(capture='f').parse('x1', search=True).group('f'), '1')
+    result = float(capture='f').parse('1.5')
+    ass(pickle.loads(pickle.dumps(result)).groupdict(), dict(f='1.5'))
+    try:
+        result.values = ()
+    except AttributeError:
+        pass
+    else:
+        ass(False)
+
+    # ahead of time
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'patterns.py')
+        with open(source, 'w') as f:
+            f.write("import dinant as d\n"
+                    "number = d.bol + d.integer(capture='n') + d.capture(d.anything) + d.eol\n"
+                    "ci = d.text('abc', flags=d.IGNORECASE)\n"
+                    "_private = d.digit\n")
+
+        # when run as a script, this module is __main__, but patterns uses dinant's expressions
+        import dinant
+
+        constants = {}
+        exec(dinant.generate_module(dinant._load_module(source)), constants)
+        ass(constants['number'], r'^(?P<n>[+-]?\d+)(.)$')
+        ass(constants['number_flags'], 0)
+        ass(constants['number_groups'], ('n', None))
+        ass(constants['ci_flags'], IGNORECASE)
+        ass('_private' in constants, False)
+
+        source = os.path.join(directory, 'star.py')
+        with open(source, 'w') as f:
+            f.write("from dinant import *\n"
+                    "number = bol + integer(capture='n') + eol\n"
+                    "same = float\n")
+
+        constants = {}
+        exec(dinant.generate_module(dinant._load_module(source)), constants)
+        ass(sorted(name for name in constants if not name.startswith('_')),
+            [ 'number', 'number_flags', 'number_groups', 'same', 'same_flags', 'same_groups' ])
+        constants = {}
+        exec(dinant.generate_module(dinant), constants)
+        ass('IPv6' in constants and 'float' in constants)
+
+        star = {}
+        exec('from dinant import *', star)
+        ass(any(name in star for name in ('os', 'time', 'array', 'partial')), False)
+        ass('integer' in star and 'IP_port' in star)
+
+    # in parallel
+    with tempfile.NamedTemporaryFile(suffix='.log') as f:
+        lines = [ line if i % 3 == 0 else 'foo %d' % i for i in range(100) ]
+        f.write('\n'.join(lines).encode())
+        f.flush()
+
+        expected = [ (result.line, result.offset, result.match.groups()) for result in render_time_re.scan(f.name) ]
+        found = [ (result.line, result.offset, result.match.groups())
+                  for result in render_time_re.parallel_scan(f.name, processes=2, shard_size=1000) ]
+        ass(found, expected)
+        ass(len(found), 34)
+
+        found = list(render_time_re.parallel_match(lines, processes=2, shard_size=7))
+        ass(len(found), 100)
+        ass([ result is not None for result in found ], [ i % 3 == 0 for i in range(100) ])
+        ass(found[3].groupdict()['layer'], 'terrain-small')
+        ass(found[3].span('wall_time'), (0, 8))
+
+        found = list(integer(capture='n').parallel_match([ b'a 1', b'22' ], search=True, processes=2))
+        ass([ result.group('n') for result in found ], [ b'1', b'22' ])
+        ass(found[0].span(), (2, 3))
+
+    # rule sets
+    rules = RuleSet(render_time=render_time_re,
+                    sip=begin_SIP_message_re,
+                    pair=capture(anything, name='client') + backref('client'),
+                    number=bol + integer(capture='client') + eol)
+
+    result = rules.match(line)
+    ass(result.rule, 'render_time')
+    ass(result.groups, dict(wall_time='36569.12', cpu_time='35251.71', layer='terrain-small',
+                            style='terrain-small'))
+
+    result = rules.match('[Apr 27 06:25:21] <--- Transmitting (no NAT) to 85.31.193.210:5060 --->')
+    ass(result.rule, 'sip')
+    ass(result.groups, dict(timestamp='Apr 27 06:25:21', client='85.31.193.210:5060'))
+
+    ass(rules.match('xx').groups, dict(client='x'))
+    ass(rules.match('42').rule, 'number')
+    ass(rules.match('42').groups, dict(client='42'))
+    ass(rules.match('xy'), None)
+    ass(rules.search('.. xx').rule, 'pair')
+    ass(rules.match(b'42').groups, dict(client=b'42'))
+    for raw in (regexp('(?P<x>a)'), bol + capture(anything) + regexp(r'\1') + eol, regexp('(?P=x)'),
+                regexp('(a)?(?(1)b|c)')):
+        try:
+            RuleSet(a=regexp('a'), b=raw)
+        except ValueError:
+            pass
+        else:
+            ass(False)
+    ass(RuleSet(a=regexp(r'(a)\\1')).match('a\\1').rule, 'a')
+    test(either('a', 'ab'), 'ab', ('a', ))
+
+    # tries
+    ass(str(either('ab', 'a')), 'ab?')
+    ass(str(either('+', '-')), '[+\\-]')
+    test(either('ab', 'a'), 'ab', ('ab', ))
+    test(either_words('a', 'ab', 'car', 'cat'), 'ab', ('ab', ))
+    test(either_words('a', 'ab', 'car', 'cat'), 'cat', ('cat', ))
+    test(either_words('a', 'ab', 'car', 'cat'), 'ca')
+    test(either_words('a', 'ab', 'car', 'cat', capture='word'), 'car', ('car', ))
+
+    # character classes
+    ass(str(CharClass('a-z0-9_.') | 'A-Za-z0-9-'), '[\\-.0-9A-Z_a-z]')
+    ass(str(CharClass('a-z') & 'h-q'), '[h-q]')
+    ass(str(CharClass('a-f') - 'aeiou'), '[b-df]')
+    ass(str(~CharClass('\\n')), '[^\\n]')
+    ass(str(CharClass('^\\x00-\\x09\\x0b-\\U0010ffff')), '[\\n]')
+    ass(str(CharClass('ab') - 'ab'), '[^\\s\\S]')
+    ass(CharClass('a-c') == CharClass('cba'))
+    ass('é' in CharClass('\\w'))
+    ass('x' not in CharClass('a-f\\d'))
+    ass(str(CharClass('\\d_') | '\\w'), '[_\\d\\w]')
+    ass('1' not in CharClass('\\w') - '\\d')
+    ass('Ω' in CharClass('\\p{Greek}') & '\\p{Lu}')
+    ass('ω' not in CharClass('\\p{Greek}') & '\\p{Lu}')
+    ass('a' in CharClass('\\P{Greek}'))
+    ass('a' in CharClass('\\p{L}') and 'Ω' in CharClass('\\p{L}'))
+    ass('1' not in CharClass('\\p{L}'))
+    ass('中' in CharClass('\\p{Han}') and '豈' in CharClass('\\p{Han}'))
+    ass('a' not in CharClass('\\p{Han}'))
+    ass(all(unicodedata.category(chr(start)) == unicodedata.category(chr(end)) == 'Lt'
+            for start, end in _unicode_property('Lt')))
+    for unsupported in ('Common', 'Inherited', 'Klingon'):
+        try:
+            CharClass('\\p{%s}' % unsupported)
+        except ValueError:
+            pass
+        else:
+            ass(False)
+    ass('ꀀ' in CharClass('\\p{Yi}'))
+    ass(any_of(CharClass('\\p{Nd}')).match('٣') is not None)
+    test(none_of(CharClass('a-z')) + 'x', 'ax')
+    test(CharClass('a-c') + 'x', 'bx', ('bx', ))
+    ass(str(either('a', digit, any_of('x-z'))), '[ax-z\\d]')
+    ass(str(either('a', 'bc', digit, any_of('x-z'))), '(?:a|bc|[x-z\\d])')
+    ass(str(either(digit, '_', any_of('a-z'), capture='c')), '(?P<c>[_a-z\\d])')
+    ass(str(either(any_of('a-z'), 'é')), '(?:[a-z]|é)')
+    ass(str(either(any_of('a-z'), any_of('^\\d'))), '(?:[a-z]|[^\\d])')
+    ass(str(then('x') + either(regexp('a|b'))), 'x(?:a|b)')
+    ass(str(then('x') + either('a' + digit)), 'x(?:a\\d)')
+    ass(str(then('x') + either('a', 'b')), 'x[ab]')
+
+    # streams
+    async def chunks(*chunks):
+        for chunk in chunks:
+            yield chunk
+
+    async def collect(iterator):
+        return [ item async for item in iterator ]
+
+    found = asyncio.run(collect(integer(capture='n').stream(chunks(b'12\nfoo\n3', b'4\n', b'', b'5'))))
+    ass([ (result.line, result.match.group('n')) for result in found ], [ (1, b'12'), (3, b'34'), (4, b'5') ])
+    found = asyncio.run(collect(integer.stream(chunks(b'a 1\nb', b' 22\n'), search=True)))
+    ass([ (result.line, result.match.group()) for result in found ], [ (1, b'1'), (2, b'22') ])
+    # the end of the long line is dropped, even if it crosses chunks
+    found = asyncio.run(collect((bol + integer + eol).stream(chunks(b'1234', b'5678', b'9\n1', b'2\n'),
+                                                             max_line_length=3)))
+    ass([ (result.line, result.match.group()) for result in found ], [ (1, b'123'), (2, b'12') ])
+
+    async def reader():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b'42\nxx\n')
+        reader.feed_data(b'[Apr 27 06:25:21] <--- Transmitting (no NAT) to 85.31.193.210:5060 --->')
+        reader.feed_eof()
+
+        return await collect(rules.stream(reader, chunk_size=5))
+
+    found = asyncio.run(reader())
+    ass([ (result.line, result.match.rule) for result in found ], [ (1, 'number'), (2, 'pair'), (3, 'sip') ])
+    ass(found[2].match.groups['client'], b'85.31.193.210:5060')
+
+    # prefilter
+    ass(render_time_re._literals(''), ("| rendering style for layer: '", "' and style '", 'ms (cpu '))
+    ass(render_time_re._literals(b'')[-1], b'ms (cpu ')
+    ass(render_time_re._literals('', flags=IGNORECASE), ())
+    ass((text('abc', flags=IGNORECASE) + 'de' + neg_lookahead('xyz') + maybe('q') +
+         one_or_more('rst') + either('u', 'v'))._literals(''), ('rst', 'de'))
+    ass(render_time_re.match(line.replace('(cpu', '(CPU')), None)
+    ass(render_time_re.match(line.replace('(cpu', '(CPU'), flags=IGNORECASE) is not None)
+    ass(render_time_re.match(memoryview(line.encode())) is not None)
+    ass(list(render_time_re.parallel_match([ line, 'foo', 'ms (cpu ' ], processes=1))[1:], [ None, None ])
+    with ThreadPoolExecutor(1) as executor:
+        ass(list(render_time_re.parallel_match([ memoryview(b'foo') ], executor=executor)), [ None ])
+    ass([ match.group('layer') for match in
+          render_time_re.parallel_match([ memoryview(line.encode()) ], processes=1) ], [ b'terrain-small' ])
+    test(bol + 'a' + digits + 'é', 'a1é', ('a1é', ))
+    test(bol + 'a' + digits + 'é', b'a1\xc3\xa9', (b'a1\xc3\xa9', ))
+    test(bol + 'a' + digits + 'é', 'a1e')
+    # inline flags
+    ass((regexp('(?i)') + 'foo').match('FOO') is not None)
+    ass((regexp('(?i:x)') + 'foo')._literals(''), ())
+    ass((regexp('(?i)') + 'foo').search(b'a FOO') is not None)
+    # alternatives and groups split among raw regexps
+    ass((regexp('(?:') + 'foo' + regexp('|bar)') + eol).match('bar') is not None)
+    ass((regexp('a|b') + 'b').match('aa') is not None)
+    ass((regexp('(a)') + 'foo')._literals(''), ('foo', ))
+    ass(_balanced(r'(\(a[(])'))
+    ass(not _balanced('(?:a'))
+
+    # instrumentation
+    cache_clear()
+    counted = (bol + integer(capture='n') + eol).instrument('tests.integer')
+    ass(counted.match('42').group('n'), '42')
+    ass(counted.match('foo'), None)
+    ass(counted.matches(b'7'))
+    ass(counted.search('a 1'), None)
+    ass(counted.parse('x', search=True), None)
+    ass((bol + integer + eol).match('1') is not None)
+    found = stats()['tests.integer']
+    ass((found.calls, found.matches, found.misses, found.hit_ratio), (5, 2, 3, 0.4))
+    ass(sorted(found.percentiles), [ 50, 90, 99 ])
+    ass(found.total_time >= found.percentiles[99] >= found.percentiles[50] > 0)
+    ass(found.compile_time > 0)
+    ass(stats(reset=True, percentiles=(75, ))['tests.integer'].percentiles.keys(), { 75 })
+    ass(stats()['tests.integer'], PatternStats(0, 0, 0, None, 0.0, {}, 0.0))
+    # an equal expression was already compiled
+    cached = (bol + integer + eol).instrument('tests.cached')
+    ass(cached.match('1') is not None)
+    compile_time = stats()['tests.cached'].compile_time
+    ass(compile_time > 0)
+    ass(cached.search('2') is not None)
+    ass(stats()['tests.cached'].compile_time, compile_time)
+    for i in range(5):
+        cached.match(str(i))
+    ass(_stats['tests.cached'].times.maxlen, 1000)
+    cached = (bol + integer + eol).instrument('tests.cached', samples=3)
+    ass((_stats['tests.cached'].times.maxlen, len(_stats['tests.cached'].times)), (3, 3))
+    (bol + integer + eol).instrument('tests.cached')
+    ass(_stats['tests.cached'].times.maxlen, 3)
+
+    # engines
+    linear = render_time_re(engine='linear')
+    ass(linear.engine_used(), 'linear')
+    ass(linear.match(line).groupdict(), render_time_re.match(line).groupdict())
+    ass(linear.match(line.encode()).span('layer'), render_time_re.match(line.encode()).span('layer'))
+    ass(linear.match('x' + line), None)
+    ass(render_time_re.engine_used(), 're')
+    ass((bol + IP_port(capture='client', type=True) + eol)(engine='linear').match('10.0.0.1:80').group('client'),
+        (ipaddress.ip_address('10.0.0.1'), 80))
+    ass((bol + IP_port + eol)(engine='auto').engine_used(), 'linear')
+    ass(integer(engine='linear').search(b'foo -42').group(), b'-42')
+    ass([ match.group() for match in integer(engine='linear').finditer('1 a 22 +3') ], [ '1', '22', '+3' ])
+    ass([ match.group() for match in integer.finditer('1 a 22 +3') ], [ '1', '22', '+3' ])
+    ass(list(text('a', engine='linear').finditer('bbb')), [])
+    ass(text('a', engine='linear').match('A', flags=IGNORECASE).group(), 'A')
+    ass((bol + 'a' + eol + '\n' + bol + 'b')(engine='linear', flags=MULTILINE).search('x\na\nb').span(), (2, 5))
+    ass((regexp('\\b') + 'foo' + regexp('\\b'))(engine='linear').search('a foo b').span(), (2, 5))
+    ass((regexp('\\b') + 'foo' + regexp('\\b'))(engine='linear').search('afoo b'), None)
+    # lines that make re backtrack forever
+    evil = bol + one_or_more(one_or_more(digit)) + 'x' + eol
+    ass(evil(engine='linear').match('1' * 5000 + 'xy'), None)
+    ass(evil(engine='linear').match('1' * 5000 + 'x').span(), (0, 5001))
+
+    pair = capture(anything, name='c') + backref('c')
+    ass(pair(engine='auto').engine_used(), 're')
+    ass(pair(engine='auto').match('xx').group(), 'xx')
+    ass(one_or_more(capture(maybe('a')))(engine='auto').engine_used(), 're')
+    # the same results as re, whichever engine 'auto' picks
+    nullable = ( one_or_more(maybe(anything, greedy=False)),
+                 anything + one_or_more(zero_or_more(any_of('ab'), greedy=False)),
+                 zero_or_more(either('a', maybe('b'))) + 'b',
+                 one_or_more(capture(maybe('a'))) + capture(one_or_more('b')),
+                 between(1, 3, zero_or_more('a', greedy=False) + maybe('b')) )
+    for expression in nullable + ( one_or_more(any_of('ab')) + 'a', zero_or_more('ab', greedy=False) + eol ):
+        compiled = re.compile(str(expression))
+        for length in range(5):
+            for chars in itertools.product('ab ', repeat=length):
+                s = ''.join(chars)
+                for method in ('match', 'search'):
+                    found = getattr(expression(engine='auto'), method)(s)
+                    expected = getattr(compiled, method)(s)
+                    ass(found is None, expected is None)
+                    if expected is not None:
+                        ass((found.span(), found.groups()), (expected.span(), expected.groups()))
+
+    for expression in nullable:
+        ass(expression(engine='auto').engine_used(), 're')
+    ass(atomic('ab')(engine='auto').engine_used(), 're')
+    for unsupported in (pair, lookahead('a'), atomic('ab'), one_or_more('ab', possessive=True)):
+        try:
+            unsupported(engine='linear').match('a')
+        except ValueError:
+            pass
+        else:
+            ass(False)
+
+    try:
+        digit(engine='foo')
+    except ValueError:
+        pass
+    else:
+        ass(False)
+
+    compiled = []
+    def engine(expression, flags, binary):
+        compiled.append(str(expression))
+        return re.compile(str(expression), flags)
+
+    register_engine('tests.engine', engine)
+    ass((digit + 'b')(engine='tests.engine').match('1b').group(), '1b')
+    ass(compiled, [ '\\db' ])
+    del _engines['tests.engine']
+
+    # grep
+    def grep(*args):
+        # the expressions in the modules are dinant's, not __main__'s
+        import dinant
+
+        out = io.TextIOWrapper(io.BytesIO(), encoding='utf-8')
+        with contextlib.redirect_stdout(out):
+            status = dinant._grep_main(list(args))
+
+        out.flush()
+
+        return status, out.buffer.getvalue().decode()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'log')
+        with open(path, 'w') as f:
+            f.write(line + '\nfoo 12 bar\n-7 and\t8\n')
+
+        ass(grep("integer(capture='n', type=True)", path, '-n', '-f', 'jsonl'),
+            (0, '{"line": 1, "n": 36569}\n{"line": 2, "n": 12}\n{"line": 3, "n": -7}\n'))
+        ass(grep('-f', 'tsv', '--header', "integer(capture='n') + ' ' + capture(anything, name='rest')", path),
+            (0, 'n\trest\n12\tb\n-7\ta\n'))
+        ass(grep('-c', '-x', 'integer + " " + one_or_more(anything)', path, path), (0, '%s:1\n%s:1\n' % (path, path)))
+        ass(grep('-x', 'integer + " and"', path), (1, ''))
+        ass(grep('-x', '-j', '2', "either('foo', 'foo 12 bar')", path), (0, 'foo 12 bar\n'))
+        ass(grep('--line-regexp', "regexp('foo|-7 and')", path), (1, ''))
+        ass(grep('-b', '-j', '2', "' 12 '", path), (0, 'foo 12 bar\n'))
+        ass(grep("integer + 'x'", path), (1, ''))
+        ass(grep('-f', 'tsv', "capture(one_or_more(none_of(' ')), name='w') + eol", path),
+            (0, "'terrain-small'\nbar\nand\\t8\n"))
+
+        module = os.path.join(directory, 'patterns.py')
+        with open(module, 'w') as f:
+            f.write('from dinant import *\n'
+                    'number = bol + integer(capture="n") + " "\n'
+                    'word = bol + capture(one_or_more(any_of("a-z")), name="w")\n')
+
+        ass(grep('-m', module, '-f', 'jsonl', path), (0, '{"rule": "word", "w": "foo"}\n{"rule": "number", "n": "-7"}\n'))
+        ass(grep('-m', module, '-p', 'number', path), (0, 'number:-7 and\t8\n'))
+        ass(grep('-m', module, '-x', path), (1, ''))
+
+    # interning
+    ass(any_of('+-').node is any_of('+-').node)
+    ass((bol + integer).node is (bol + integer).node)
+    ass(one_or_more(digit).node is not one_or_more(digit, greedy=False).node)
+    ass(capture(digit, type=_int).node is not capture(digit, type=_float).node)
+    ass(len({ bol + integer, bol + integer, then('a') + 'b', then('ab') }), 2)
+    ass({ integer: 'integer' }[maybe(any_of('+-')) + one_or_more(digit)], 'integer')
+    ass(hash(text('a', flags=IGNORECASE)) != hash(text('a')))
+    ass(integer(capture='n', type=int) != integer(capture='n', type=float))
+    ass(len({ integer(capture='n', type=int), integer(capture='n', type=float), integer(capture='n') }), 3)
+    ass(integer(capture='n', type=int), integer(capture='n', type=int))
+    ass(integer != integer(engine='linear'))
+
+    # possessive
+    ass(str(one_or_more(digit, possessive=True)), '(?:\\d)++')
+    ass(str(zero_or_more(digit, possessive=True).simplify()), '\\d*+')
+    ass(str(maybe('a', possessive=True).simplify()), 'a?+')
+    ass(str(between(1, 3, digit, possessive=True)), '\\d{1,3}+')
+    ass(str(at_least(2, digit, possessive=True)), '\\d{2,}+')
+    ass(str(exactly(2, 'ab', possessive=True)), '(?:ab){2}+')
+    ass(str(digit(times=[1, ], possessive=True).simplify()), '\\d++')
+    ass(str(digit(times=[0, 1], possessive=True).simplify()), '\\d?+')
+    ass(str(atomic('a' + digits)), '(?>a\\d)')
+    ass(str(regexp('ab')(times=1, possessive=True).simplify()), '(?>ab)')
+    test(bol + one_or_more(digit, possessive=True) + eol, '123', ('123', ))
+    test(bol + one_or_more(digit, possessive=True) + digit, '123')
+    test(bol + one_or_more(digit) + digit, '123', ('123', ))
+    test(bol + atomic(either('a', 'ab')) + 'b', 'ab', ('ab', ))
+    test(bol + atomic(either('a', 'ab')) + 'c', 'abc')
+    test(uint, '123', ('123', ))
+    # the standard ones give back, so they can be followed by anything
+    ass((integer + '0').match('100').group(), '100')
+    ass((bol + uint + digit + eol).match('12') is not None)
+    ass((hex + 'f').match('ff').group(), 'ff')
+    test(IPv4, '10.0.0.1', ('10.0.0.1', ))
+    test(bol + IPv4 + eol, '10.0.0.1234')
+    try:
+        one_or_more(digit, greedy=False, possessive=True)
+    except ValueError:
+        pass
+    else:
+        ass(False)
+
+    ass(one_or_more(one_or_more(digit), possessive=True).analyze().worst_case, 'linear')
+    ass((one_or_more(digit, possessive=True) + one_or_more(digit)).analyze().worst_case, 'linear')
+    ass((one_or_more(digit) + one_or_more(digit, possessive=True)).analyze().worst_case, 'O(n^2)')
+    ass(str((one_or_more(digit, possessive=True) + digit).safe()), '\\d++\\d')
+
+    # backtracking
+    ass(integer.analyze(), Analysis('linear', []))
+    ass(render_time_re.analyze().worst_case, 'linear')
+    ass(one_or_more(one_or_more(digit)).analyze().worst_case, 'exponential')
+    ass(one_or_more(one_or_more(digit)).analyze().issues[0].kind, 'nested quantifiers')
+    ass(one_or_more(one_or_more(digit) + maybe('.')).analyze().worst_case, 'exponential')
+    ass(zero_or_more('[' + zero_or_more(any_of('a-z')) + ']').analyze().worst_case, 'linear')
+    ass(one_or_more(either('a', 'ab', capture=True)).analyze().worst_case, 'exponential')
+    ass((one_or_more(digit) + then(',') + one_or_more(digit)).analyze().worst_case, 'linear')
+    ass((one_or_more(digit) + maybe(',') + one_or_more(digit) + zero_or_more(digit)).analyze().worst_case, 'O(n^3)')
+    ass(((one_or_more('a') + one_or_more('b'))).analyze().worst_case, 'linear')
+
+    ass(str(one_or_more(one_or_more(digit)).safe()), '\\d+')
+    ass(str(zero_or_more(one_or_more(digit)).safe()), '\\d*')
+    ass(str((one_or_more(digit) + one_or_more(digit) + zero_or_more(digit)).safe()), '\\d{2,}')
+    ass(str((digit + one_or_more(digit) + maybe(digit)).safe()), '\\d{2,}')
+    ass(str(either(regexp('a+'), regexp('a+')).safe()), 'a+')
+    ass(str((capture(one_or_more(digit)) + one_or_more(digit)).safe()), '(\\d+)\\d+')
+    ass(capture(regexp('a|b') + zero_or_more(regexp('a|b'))).safe().match('aa').group(1), 'a')
+    ass(one_or_more(one_or_more(digit)).safe().analyze().worst_case, 'linear')
+    test(bol + (one_or_more(digit) + one_or_more(digit)).safe() + eol, '123', ('123', ))
+    test(bol + (one_or_more(digit) + one_or_more(digit)).safe() + eol, '1')
 
     print('A-OK!')
 
@@ -588,8 +4863,34 @@ if __name__ == '__main__':
     run_tests_re = bol + 'run' + any_of('-_ ') + 'test' + maybe('s') + eol
     if run_tests_re.matches(s):
         run_tests()
+    elif sys.argv[1:2] == [ 'compile' ]:
+        # the expressions in the module are dinant's, not __main__'s
+        import dinant
+        dinant._compile_main(sys.argv[2:])
+    elif sys.argv[1:2] == [ 'grep' ]:
+        import dinant
+        sys.exit(dinant._grep_main(sys.argv[2:]))
     else:
-        print(eval(s))
+        print(_evaluate(s))
 
 
 del run_tests
+
+# the public API; star imports build the lazy standard expressions listed here,
+# import dinant and from dinant import name don't
+__all__ = [
+    # flags
+    'IGNORECASE', 'MULTILINE', 'DOTALL', 'ASCII',
+    # building
+    'Dinant', 'CharClass', 'regexp', 'then', 'text', 'typed', 'wrap', 'captures',
+    'any_of', 'none_of', 'either', 'either_words', 'capture', 'backref', 'comment',
+    'lookahead', 'neg_lookahead', 'lookbehind', 'neg_lookbehind', 'atomic',
+    'one_or_more', 'zero_or_more', 'maybe', 'exactly', 'between', 'at_most', 'at_least',
+    # standard expressions
+    'anything', 'bol', 'eol', 'digit', 'digits', 'datetime',
+    'uint', 'int', 'integer', 'float', 'hex', 'hexa', 'IPv4', 'IPv6', 'IP_number', 'IP_port',
+    # matching
+    'Match', 'ScanMatch', 'StreamMatch', 'DebugResult', 'RuleSet', 'RuleMatch',
+    'Analysis', 'Issue', 'register_engine', 'generate_module',
+    'CacheInfo', 'cache_info', 'cache_clear', 'set_cache_size', 'PatternStats', 'stats',
+    ]